@@ -1,14 +1,36 @@
 """Main Method"""
+import argparse
+import sys
+
 from proj2functions import *
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Saving Starving Students")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="run the JSON-lines queries in FILE ('-' for standard input) instead of the menu")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="record stage timings and counters and write them as JSON to FILE ('-' for standard "
+                             "error) on exit")
+    parser.add_argument('--stats-memory', action='store_true', help="also record the current and peak memory usage")
+    parser.add_argument('--lazy-text', action='store_true',
+                        help="read recipe instructions and full ingredients from the recipe file only when shown")
+    args = parser.parse_args()
+    if args.stats:
+        import proj2stats
+        proj2stats.enable(args.stats, args.stats_memory)
+    if args.batch:
+        from proj2queries import run_batch_file
+        main_graph = load_graph('food copy.csv', 'ingredients copy.csv',
+                                'ingredient_prices.csv', snapshot='graph.snapshot', lazy=args.lazy_text)
+        sys.exit(run_batch_file(main_graph, args.batch))
+
     print("Saving Starving Students || Loading")
     choices = ["1) Enter ingredients you already have", "2) Find common ingredients based on filters",
-               "3) Find ingredient pairings", "4) Show visualisation of recipes", "5) Quit"]
+               "3) Find ingredient pairings", "4) Show visualisation of recipes", "5) Plan meals on a budget",
+               "6) Quit"]
     end = False
     main_graph = load_graph('food copy.csv', 'ingredients copy.csv',
-                            'ingredient_prices.csv')
-    all_ingredients = get_food('ingredients copy.csv')
+                            'ingredient_prices.csv', snapshot='graph.snapshot', lazy=args.lazy_text)
 
     while not end:
         print("===================================")
@@ -17,7 +39,7 @@ if __name__ == '__main__':
             print("-", action)
 
         choice = input("\nSelect from the following (enter a number): ").lower().strip()
-        while choice not in ["1", "2", "3", "4", "5"]:
+        while choice not in ["1", "2", "3", "4", "5", "6"]:
             print("===================================")
             print("Invalid entry, try again")
             print("===================================")
@@ -34,5 +56,7 @@ if __name__ == '__main__':
             option_3(main_graph)
         elif choice == "4":
             option_4(main_graph)
+        elif choice == "5":
+            option_5(main_graph)
         else:
             end = True
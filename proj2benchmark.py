@@ -0,0 +1,350 @@
+"""Benchmarks for the recipe graph in proj2functions.
+
+Run this file with one of these commands:
+
+    python proj2benchmark.py generate 10000 100000 1000000
+        Write synthetic recipe files shaped like 'food copy.csv' (food_10000.csv, ...).
+    python proj2benchmark.py run food_10000.csv --output results.json [--baseline baseline.json]
+        Time and memory-profile the main graph operations on a recipe file and save the results as JSON.
+        With a baseline, every result more than --tolerance worse than the baseline is reported as a
+        regression, and the exit status is 1 if there are any.
+    python proj2benchmark.py memory food_10000.csv
+        Print how many bytes each recipe takes in a loaded graph, in the normal and compact storage modes, and
+        with lazy recipe text.
+    python proj2benchmark.py imports [main]
+        Print how long a new interpreter takes to import a module (main.py by default, which is what starting
+        the menu imports), and the modules that take the longest, from python -X importtime. The import time of
+        main is also one of the results of run.
+    python proj2benchmark.py rss food_10000.csv
+        Print the peak resident memory of processes that build a graph from a recipe file by streaming its rows
+        into the graph (build_graph) and by making lists of every cleaned row and Recipe first.
+"""
+from __future__ import annotations
+import argparse
+import csv
+import gc
+import json
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from proj2functions import IngredientLexicon, build_graph, cleancsv, get_food, load_graph, pricestodict
+from proj2planner import plan_meals
+
+UNITS = ['cup', 'cups', 'Tbsp.', 'tsp.', 'oz.', 'lb.', 'pinch of', 'large', 'small', 'whole']
+PREPARATIONS = ['', ', chopped', ', thinly sliced', ', divided', ', room temperature', ', plus more for serving']
+DISHES = ['Salad', 'Soup', 'Stew', 'Bake', 'Tart', 'Roast', 'Skillet', 'Curry', 'Sandwich', 'Pasta']
+
+# run by peak_rss in a new process, with the mode and the three csv files as arguments
+_PEAK_RSS_SCRIPT = """
+import resource, sys
+from proj2functions import Graph, build_graph, cleancsv, pricestodict, to_recipe_class
+mode, uncleaned, ingredients, pricefile = sys.argv[1:]
+if mode == 'stream':
+    graph = build_graph(uncleaned, ingredients, pricefile)
+elif mode == 'lists':
+    prices = pricestodict(pricefile)
+    cleaned_csv = cleancsv(uncleaned, ingredients, prices)
+    recipe_lst = to_recipe_class(cleaned_csv)
+    graph = Graph()
+    for recipe in recipe_lst:
+        graph.add_vertex(recipe, prices)
+        graph.add_edge(recipe.title)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024))
+"""
+
+
+def generate_corpus(path: str, recipes: int, pricefile: str = 'ingredient_prices.csv', seed: int = 0,
+                    skew: float = 1.0) -> None:
+    """Write a synthetic recipe csv file with the given number of recipes to path, in the same shape as
+    'food copy.csv'.
+
+    Ingredients are drawn from the ingredients in pricefile with a Zipf-like skew: the ingredient of rank r
+    (in a shuffled order) is picked with weight 1 / r ** skew, so a few ingredients appear in most recipes
+    and most appear in few, as in the real data. Ingredients without a price are left out, since cleancsv drops
+    the recipes that use them, so every row of the file is loaded as a recipe. Rows are written one at a time, so
+    any size fits in memory.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'food_500.csv')
+    >>> generate_corpus(path, 500)
+    >>> len(cleancsv(path, 'ingredients copy.csv', pricestodict('ingredient_prices.csv')))
+    500
+    """
+    rng = random.Random(seed)
+    with open(pricefile, 'r', encoding="utf-8") as file:
+        reader = csv.reader(file)
+        next(reader)
+        names = [row[0].lower() for row in reader if row[1].strip() != '']
+    rng.shuffle(names)
+
+    cumulative_weights = []
+    total = 0.0
+    for rank in range(1, len(names) + 1):
+        total += 1 / rank ** skew
+        cumulative_weights.append(total)
+
+    with open(path, 'w', encoding="utf-8", newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['', 'Title', 'Ingredients', 'Instructions', 'Image_Name', 'Cleaned_Ingredients'])
+        for i in range(recipes):
+            chosen = list(dict.fromkeys(rng.choices(names, cum_weights=cumulative_weights, k=rng.randint(4, 16))))
+            lines = [str(rng.randint(1, 4)) + ' ' + rng.choice(UNITS) + ' ' + name
+                     + ('s' if rng.random() < 0.2 else '') + rng.choice(PREPARATIONS) for name in chosen]
+            title = chosen[0].title() + ' ' + rng.choice(DISHES) + ' ' + str(i)
+            instructions = '\n'.join('Add the ' + name + ' and stir "gently" for ' + str(rng.randint(1, 20))
+                                     + ' minutes.' for name in chosen)
+            writer.writerow([i, title, str(lines), instructions, title.lower().replace(' ', '-'), str(lines)])
+
+
+def measure(function: Callable[[], Any], repeat: int = 3, memory: bool = True) -> dict[str, float]:
+    """Return the best time in seconds of repeat calls to function, and if memory is True, the peak memory
+    in bytes allocated during one more call (measured separately, since tracemalloc slows calls down).
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    result = {'seconds': best}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def import_times(module: str = 'main', repeat: int = 3, top: int = 10) -> dict[str, Any]:
+    """Return the best time in seconds of repeat imports of module, each in a new interpreter, and the top
+    modules that took the longest to import in the last of them (including what they import in turn), as
+    (seconds, module name) pairs. The times come from python -X importtime.
+    """
+    best, times = float('inf'), {}
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                capture_output=True, text=True, check=True)
+        times = {}
+        for line in result.stderr.splitlines():
+            # lines look like "import time:       512 |       2048 |   csv", in microseconds
+            fields = line.partition('import time:')[2].split('|')
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                times[fields[2].strip()] = int(fields[1]) / 1e6
+        best = min(best, times.get(module, 0.0))
+    slowest = sorted(((seconds, name) for name, seconds in times.items() if name != module), reverse=True)
+    return {'seconds': best, 'slowest': slowest[:top]}
+
+
+def peak_rss(uncleaned: str, ingredients: str, pricefile: str) -> dict[str, int]:
+    """Return the peak resident memory in bytes of new processes that only import proj2functions ('import'), that
+    build a graph from the given csv files with build_graph ('stream'), and that build it from lists of every
+    cleaned row and Recipe, the way build_graph used to ('lists').
+
+    This needs the resource module, which Windows does not have.
+    """
+    results = {}
+    for mode in ('import', 'stream', 'lists'):
+        output = subprocess.run([sys.executable, '-c', _PEAK_RSS_SCRIPT, mode, uncleaned, ingredients, pricefile],
+                                capture_output=True, text=True, check=True).stdout
+        results[mode] = int(output.split()[-1])
+    return results
+
+
+def run_benchmarks(uncleaned: str, ingredients: str, pricefile: str, repeat: int = 3,
+                   memory: bool = True) -> dict[str, Any]:
+    """Return the timing (and peak memory) of the main graph operations on the given csv files.
+
+    Queries use the four most connected ingredients of the graph (the fifty most connected, for the pantry
+    query), and the price limit is the median recipe price (or the 10th percentile, for the narrow query). The
+    review limit is checked against reviews.csv in the current directory.
+    """
+    prices = pricestodict(pricefile)
+    graph = build_graph(uncleaned, ingredients, pricefile)
+    ingredient_names = [item for _, item, _ in graph.get_most_connected_ingredients()][:4]
+    recipe_prices = sorted(vertex.price for vertex in graph.filter_kind('recipe'))
+    median_price = recipe_prices[len(recipe_prices) // 2] if recipe_prices else 0.0
+    cheap_price = recipe_prices[len(recipe_prices) // 10] if recipe_prices else 0.0
+    pantry = [item for _, item in sorted((-vertex.depth(), vertex.item) for vertex in graph.filter_kind('ingredient'))]
+    pantry = pantry[:50]
+
+    benchmarks = {
+        'cleancsv': measure(lambda: cleancsv(uncleaned, ingredients, prices), 1, memory),
+        'load_graph': measure(lambda: load_graph(uncleaned, ingredients, pricefile), 1, memory),
+        'filter_recipes': measure(
+            lambda: graph.filter_recipes(10, ingredient_names, prices, None, None), repeat, memory),
+        'filter_recipes_limits': measure(
+            lambda: graph.filter_recipes(10, ingredient_names, prices, median_price, 3), repeat, memory),
+        'filter_recipes_narrow': measure(
+            lambda: graph.filter_recipes(10, [], prices, cheap_price, 4), repeat, memory),
+        'filter_recipes_all': measure(
+            lambda: graph.filter_recipes(14000, [], prices, median_price, None), repeat, memory),
+        'filter_recipes_pantry': measure(
+            lambda: graph.filter_recipes(10, pantry, prices, None, None, pantry=True), repeat, memory),
+        'filter_recipes_cost': measure(
+            lambda: graph.filter_recipes(10, ingredient_names, prices, median_price, None, rank='cost'), repeat,
+            memory),
+        'filter_recipes_exclude': measure(
+            lambda: graph.filter_recipes(10, ingredient_names, prices, median_price, None,
+                                         excluded=ingredient_names[2:]), repeat, memory),
+        'top_ingredients': measure(lambda: graph.top_ingredients(10, median_price, 3), repeat, memory),
+        'get_similar': measure(lambda: graph.get_similar(ingredient_names[0]), repeat, memory),
+        'get_pairings': measure(lambda: graph.get_pairings(ingredient_names[0]), repeat, memory),
+        'get_most_connected_ingredients': measure(graph.get_most_connected_ingredients, repeat, memory),
+        'to_networkx': measure(graph.to_networkx, repeat, memory),
+        'lexicon': measure(lambda: IngredientLexicon({name: 0 for name in get_food(ingredients)}), 1, memory),
+        'lexicon_lookup': measure(lambda: graph.lexicon().lookup(ingredient_names[0].upper() + 's'), repeat, memory),
+        'lexicon_complete': measure(lambda: graph.lexicon().complete(ingredient_names[0][:2]), repeat, memory),
+        'lexicon_suggest': measure(lambda: graph.lexicon().suggest(ingredient_names[0][1:]), repeat, memory),
+    }
+    # raise the prices of five fairly common ingredients by 10%, and put them back on the next call
+    by_depth = sorted(graph.filter_kind('ingredient'), key=lambda vertex: vertex.depth(), reverse=True)
+    price_tables = [dict(prices), prices]
+    for vertex in by_depth[10:15]:
+        price_tables[0][vertex.item] = round(vertex.price * 1.1, 2)
+
+    def reprice() -> None:
+        """Apply the price table that the graph does not have yet."""
+        price_tables.reverse()
+        graph.update_prices(price_tables[-1])
+
+    benchmarks['update_prices'] = measure(reprice, repeat, memory)
+    benchmarks['plan_meals'] = measure(lambda: plan_meals(graph, 7, median_price * 3), repeat, memory)
+    benchmarks['import_main'] = {'seconds': import_times('main', repeat)['seconds']}
+    return {'corpus': uncleaned, 'recipes': len(recipe_prices), 'benchmarks': benchmarks}
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], tolerance: float = 0.25) -> list[str]:
+    """Return a description of every benchmark in results that is more than tolerance (as a fraction)
+    slower, or uses more than tolerance more peak memory, than the same benchmark in baseline.
+
+    >>> old = {'benchmarks': {'get_similar': {'seconds': 0.010, 'peak_bytes': 1000}}}
+    >>> new = {'benchmarks': {'get_similar': {'seconds': 0.020, 'peak_bytes': 1100}}}
+    >>> compare(new, old)
+    ['get_similar seconds: 0.01 -> 0.02 (+100%)']
+    """
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name, {})
+        for metric in ('seconds', 'peak_bytes'):
+            if previous.get(metric) and metric in result and result[metric] > previous[metric] * (1 + tolerance):
+                change = round((result[metric] / previous[metric] - 1) * 100)
+                regressions.append(name + ' ' + metric + ': ' + str(round(previous[metric], 6)) + ' -> '
+                                   + str(round(result[metric], 6)) + ' (+' + str(change) + '%)')
+    return regressions
+
+
+def memory_per_recipe(uncleaned: str, ingredients: str, pricefile: str) -> dict[str, float]:
+    """Return the memory taken by a graph built from the given csv files, in bytes per recipe, before and after
+    it is switched to its compact storage mode (see Graph.compact), and for a graph built with lazy recipes (see
+    load_graph) in the normal mode.
+
+    Memory is measured with tracemalloc, so it counts everything the graph keeps alive, recipe text included.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        graph = build_graph(uncleaned, ingredients, pricefile)
+        gc.collect()
+        normal = tracemalloc.get_traced_memory()[0] - start
+
+        graph.compact()
+        gc.collect()
+        compact = tracemalloc.get_traced_memory()[0] - start
+
+        del graph
+        gc.collect()
+        start = tracemalloc.get_traced_memory()[0]
+        graph = build_graph(uncleaned, ingredients, pricefile, lazy=True)
+        gc.collect()
+        lazy = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+    recipes = max(len(graph.filter_kind('recipe')), 1)
+    return {'recipes': recipes, 'normal_bytes_per_recipe': normal / recipes,
+            'compact_bytes_per_recipe': compact / recipes, 'lazy_bytes_per_recipe': lazy / recipes}
+
+
+def main(argv: list[str]) -> int:
+    """Run the command line interface described at the top of this file, and return the exit status."""
+    parser = argparse.ArgumentParser(description="Benchmarks for the recipe graph.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="write synthetic recipe files")
+    generate.add_argument('sizes', nargs='*', type=int, default=[10000, 100000, 1000000])
+    generate.add_argument('--prices', default='ingredient_prices.csv')
+    generate.add_argument('--seed', type=int, default=0)
+
+    imports = commands.add_parser('imports', help="time importing a module")
+    imports.add_argument('module', nargs='?', default='main')
+    imports.add_argument('--repeat', type=int, default=3)
+
+    for name in ('run', 'memory', 'rss'):
+        command = commands.add_parser(name)
+        command.add_argument('uncleaned', nargs='?', default='food copy.csv')
+        command.add_argument('--ingredients', default='ingredients copy.csv')
+        command.add_argument('--prices', default='ingredient_prices.csv')
+        if name == 'run':
+            command.add_argument('--output', default='benchmark_results.json')
+            command.add_argument('--baseline')
+            command.add_argument('--tolerance', type=float, default=0.25)
+            command.add_argument('--repeat', type=int, default=3)
+            command.add_argument('--no-memory', action='store_true')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        for size in args.sizes:
+            generate_corpus('food_' + str(size) + '.csv', size, args.prices, args.seed)
+            print("Wrote food_" + str(size) + ".csv")
+        return 0
+
+    if args.command == 'imports':
+        result = import_times(args.module, args.repeat)
+        print("import " + args.module + ": " + str(round(result['seconds'] * 1000, 1)) + " ms")
+        for seconds, name in result['slowest']:
+            print("- " + name + ": " + str(round(seconds * 1000, 1)) + " ms")
+        return 0
+
+    if args.command == 'rss':
+        result = peak_rss(args.uncleaned, args.ingredients, args.prices)
+        for mode, peak in result.items():
+            print(mode + ": peak RSS " + str(round(peak / 2 ** 20, 1)) + " MiB, "
+                  + str(round((peak - result['import']) / 2 ** 20, 1)) + " MiB more than importing")
+        return 0
+
+    if args.command == 'memory':
+        result = memory_per_recipe(args.uncleaned, args.ingredients, args.prices)
+        print("Recipes: " + str(result['recipes']))
+        print("Normal mode: " + str(round(result['normal_bytes_per_recipe'])) + " bytes per recipe")
+        print("Compact mode: " + str(round(result['compact_bytes_per_recipe'])) + " bytes per recipe")
+        print("Lazy recipe text: " + str(round(result['lazy_bytes_per_recipe'])) + " bytes per recipe")
+        return 0
+
+    results = run_benchmarks(args.uncleaned, args.ingredients, args.prices, args.repeat, not args.no_memory)
+    with open(args.output, 'w', encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print("Recipes loaded: " + str(results['recipes']))
+    for name, result in results['benchmarks'].items():
+        print(name + ": " + str(round(result['seconds'] * 1000, 3)) + " ms"
+              + (" || peak " + str(result['peak_bytes']) + " bytes" if 'peak_bytes' in result else ""))
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,17 +1,35 @@
 """The helper functions for project 2"""
 from __future__ import annotations
+import array
+import bisect
+import collections
 import csv
-from dataclasses import dataclass
-from typing import Any, Optional
-import networkx as nx
-import pandas as pd
+import functools
+import heapq
+import io
+import itertools
+import math
+import mmap
+import operator
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional
 import os
-import doctest
+import proj2stats
+
+# networkx and pandas take longer to import than a graph takes to load from a snapshot, and only option 4 and saving
+# a review use them, so they are imported by the functions that need them
+if TYPE_CHECKING:
+    import networkx as nx
 
 
 class Recipe:
     """A class representing a recipe. This class is used to store and manage information about a recipe
 
+    A recipe can be lazy: then its full ingredients, instructions and image name are not kept in memory, and
+    are read from its row of the recipe csv file each time they are used (see RecipeText).
+
     Instance Attributes:
         - title: The title of the recipe.
         - title_lower: The title of the recipe in lower case.
@@ -29,23 +47,127 @@ class Recipe:
         - self.image != ""
         - self.cleaned_ingredients != []
     """
+    __slots__ = ('title', '_full_ingredients', '_instructions', '_image_name', 'cleaned_ingredients', 'price',
+                 '_text', '_offset')
     title: str
-    full_ingredients: list
-    instructions: str
-    image_name: str
     cleaned_ingredients: list
     price: float
-
-    def __init__(self, cleaned_recipe: list) -> None:
-        """Initialize a Recipe object with the given cleaned recipe data."""
+    # Private Instance Attributes:
+    #     - _full_ingredients, _instructions, _image_name:
+    #         The values of full_ingredients, instructions and image_name, or None if this recipe is lazy.
+    #     - _text:
+    #         The reader of the recipe csv file this recipe is read from if it is lazy, otherwise None.
+    #     - _offset:
+    #         The byte offset of this recipe's row in that file if it is lazy, otherwise -1.
+    _full_ingredients: Optional[list]
+    _instructions: Optional[str]
+    _image_name: Optional[str]
+    _text: Optional[RecipeText]
+    _offset: int
+
+    def __init__(self, cleaned_recipe: list, text: Optional[RecipeText] = None) -> None:
+        """Initialize a Recipe object with the given cleaned recipe data.
+
+        If text is given, the recipe is lazy: cleaned_recipe has no text (see cleancsv), and its last element is
+        the byte offset of the recipe's row in the file that text reads.
+        """
         self.title = cleaned_recipe[0]
-        self.full_ingredients = cleaned_recipe[1]
-        self.instructions = cleaned_recipe[2]
-        self.image_name = cleaned_recipe[3]
         self.cleaned_ingredients = cleaned_recipe[5]
         self.price = cleaned_recipe[6]
+        self._text = text
+        if text is None:
+            self._full_ingredients = cleaned_recipe[1]
+            self._instructions = cleaned_recipe[2]
+            self._image_name = cleaned_recipe[3]
+            self._offset = -1
+        else:
+            self._full_ingredients = self._instructions = self._image_name = None
+            self._offset = cleaned_recipe[7]
+
+    @property
+    def full_ingredients(self) -> list:
+        """The ingredients used in the recipe, in their original format."""
+        return self._full_ingredients if self._text is None else self._text.read(self._offset)[0]
+
+    @property
+    def instructions(self) -> str:
+        """The recipe's cooking instructions."""
+        return self._instructions if self._text is None else self._text.read(self._offset)[1]
+
+    @property
+    def image_name(self) -> str:
+        """The name of the image file of the recipe."""
+        return self._image_name if self._text is None else self._text.read(self._offset)[2]
+
+    @property
+    def source_offset(self) -> Optional[int]:
+        """The byte offset of the recipe's row in the recipe csv file if the recipe is lazy, otherwise None."""
+        return None if self._text is None else self._offset
 
 
+class RecipeText:
+    """Reads the full ingredients, instructions and image name of lazy recipes from their rows of a recipe csv file.
+
+    The file is memory-mapped when the first row is read, so only the pages that are used are loaded, and the
+    cache_size rows read most recently are kept parsed. The file must not change while it is being read.
+
+    >>> prices = pricestodict('ingredient_prices.csv')
+    >>> rows = cleancsv('food_small copy.csv', 'ingredients copy.csv', prices, lazy=True)
+    >>> recipe = Recipe(rows[0], RecipeText('food_small copy.csv'))
+    >>> recipe.title
+    'Miso-Butter Roast Chicken With Acorn Squash Panzanella'
+    >>> recipe.image_name
+    'miso-butter-roast-chicken-acorn-squash-panzanella'
+
+    Instance Attributes:
+        - path: the absolute path of the recipe csv file
+    """
+    path: str
+    # Private Instance Attributes:
+    #     - _file, _data:
+    #         The open file and its memory map, or None before the first row is read.
+    #     - _lock:
+    #         Held while the file is being opened, since rows can be read from more than one thread.
+    #     - _cached_row:
+    #         _parse_row, with its most recent results cached.
+    _file: Optional[Any]
+    _data: Optional[mmap.mmap]
+    _lock: threading.Lock
+    _cached_row: Any
+
+    def __init__(self, path: str, cache_size: int = 128) -> None:
+        """Initialize a reader of the recipe csv file at path, caching cache_size rows."""
+        self.path = os.path.abspath(path)
+        self._file = None
+        self._data = None
+        self._lock = threading.Lock()
+        self._cached_row = functools.lru_cache(maxsize=cache_size)(self._parse_row)
+
+    def read(self, offset: int) -> tuple[list, str, str]:
+        """Return the full ingredients, instructions and image name in the row that starts at byte offset."""
+        return self._cached_row(offset)
+
+    def _parse_row(self, offset: int) -> tuple[list, str, str]:
+        """Read and parse the row that starts at byte offset, like clean_row does."""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._file = open(self.path, 'rb')
+                    self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, row = next(_read_rows(self._data, offset, len(self._data)))
+        return parse_ingredient_list(row[2]), row[3], row[4]
+
+    def close(self) -> None:
+        """Unmap and close the file. It is opened again if another row is read."""
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+                self._file.close()
+                self._data = self._file = None
+            self._cached_row.cache_clear()
+
+
+@proj2stats.timed('get_food')
 def get_food(ingredients: str) -> list:
     """Return a list with all possible ingredients from the ingredients file.
 
@@ -62,78 +184,507 @@ def get_food(ingredients: str) -> list:
     return foods
 
 
-def cleancsv(uncleaned: str, ingredients: str, prices: dict) -> list:  # cleans the csv file
-    """Return a cleaned and processed list given CSV files. This function extracts and filters recipe data."""
+@proj2stats.timed('cleancsv')
+def cleancsv(uncleaned: str, ingredients: str, prices: dict, lazy: bool = False) -> list:  # cleans the csv file
+    """Return a cleaned and processed list given CSV files. This function extracts and filters recipe data.
 
-    foods = []
-    cleaned_csv = []
-    with open(ingredients, 'r', encoding="utf-8") as file:
-        reader = csv.reader(file)
-        next(reader)
-        for row in reader:
-            foods.append(row[0].lower())
+    If lazy is True, the rows are for lazy recipes (see _without_text), so the recipe text is not kept.
+    """
+    return list(clean_rows(uncleaned, ingredients, prices, lazy))
+
+
+def clean_rows(uncleaned: str, ingredients: str, prices: dict, lazy: bool = False) -> Iterator[list]:
+    """Yield the rows of cleancsv(uncleaned, ingredients, prices, lazy) one at a time, reading the recipe csv file
+    only as far as the rows that have been asked for.
+    """
+    matcher = IngredientMatcher(get_food(ingredients))
+    parsed, kept, matched = 0, 0, 0
+    for offset, row in _csv_rows(uncleaned, lazy):
+        parsed += 1
+        lst = clean_row(row, matcher, prices)
+        if lst is not None:
+            kept += 1
+            matched += len(lst[5])
+            yield lst if offset is None else _without_text(lst, offset)
+    _count_cleaned(parsed, kept, matched)
+
+
+def _csv_rows(uncleaned: str, lazy: bool) -> Iterator[tuple[Optional[int], list]]:
+    """Yield every row after the header of the csv file uncleaned, with the byte offset it starts at if lazy is True
+    (the file is then read through a memory map), or None otherwise.
+    """
+    if lazy:
+        with open(uncleaned, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from _read_rows(data, _row_end(data, 0, len(data)), len(data))
+    else:
+        with open(uncleaned, 'r', encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader)
+            for row in reader:
+                yield None, row
+
+
+def _without_text(cleaned_row: list, offset: int) -> list:
+    """Return cleaned_row (as clean_row returns it) for a lazy recipe whose row starts at byte offset of its file:
+    the full ingredients, instructions, image name and ingredient text are dropped, and offset is added at the end.
+    """
+    return [cleaned_row[0], None, None, None, '', cleaned_row[5], cleaned_row[6], offset]
+
+
+def _count_cleaned(parsed: int, kept: int, matched: int) -> None:
+    """Add the rows parsed, the recipes dropped because an ingredient has no price, and the ingredients matched
+    in the recipes that were kept to the stats (see proj2stats).
+    """
+    proj2stats.count('cleancsv.rows_parsed', parsed)
+    proj2stats.count('cleancsv.recipes_dropped_missing_price', parsed - kept)
+    proj2stats.count('cleancsv.ingredients_matched', matched)
 
-    with open(uncleaned, 'r', encoding="utf-8") as file:
-        reader = csv.reader(file)
-        next(reader)
-        for row in reader:
-            recipeprice = 0
-            lst = []
-            include = True
-
-            for i in range(1, 6):
-                if i == 2:
-                    str_list = row[i].strip("[]").split("', ")
-                    to_list = [items.strip("'\"") for items in str_list]
-                    lst.append(to_list)
-                else:
-                    lst.append(row[i])
-            ingredients = get_ingredients(foods, lst[1])
 
-            for item in ingredients:
-                if prices[item] == '':
-                    include = False
+def clean_row(row: list, matcher: IngredientMatcher, prices: dict) -> Optional[list]:
+    """Return the cleaned form of one row of the recipe csv file, or None if one of its ingredients has no price.
+
+    >>> row = ['0', 'Toast', "['1 slice bread', '1 Tbsp. butter']", 'Toast it.', 'toast', "['bread', 'butter']"]
+    >>> clean_row(row, IngredientMatcher(['bread', 'butter']), {'bread': 2.83, 'butter': 5.5})[4:]
+    ["['bread', 'butter']", ['bread', 'butter'], 8.33]
+    """
+    recipeprice = 0
+    lst = []
+
+    for i in range(1, 6):
+        if i == 2:
+            lst.append(parse_ingredient_list(row[i]))
+        else:
+            lst.append(row[i])
+    ingredients = matcher.match(lst[1])
+
+    for item in ingredients:
+        if prices[item] == '':
+            return None
+        recipeprice += prices[item]
+
+    lst.append(ingredients)
+    lst.append(round(recipeprice, 2))
+    return lst
+
+
+def parse_ingredient_list(text: str) -> list:
+    """Return the ingredient descriptions in the Ingredients column of the recipe csv file.
+
+    >>> parse_ingredient_list("['1 slice bread', '1 Tbsp. butter']")
+    ['1 slice bread', '1 Tbsp. butter']
+    """
+    str_list = text.strip("[]").split("', ")
+    return [items.strip("'\"") for items in str_list]
+
+
+@proj2stats.timed('cleancsv_parallel')
+def cleancsv_parallel(uncleaned: str, ingredients: str, prices: dict, workers: Optional[int] = None,
+                      lazy: bool = False) -> tuple[list, dict[int, tuple[int, float]]]:
+    """Return the same list as cleancsv(uncleaned, ingredients, prices, lazy), computed by a pool of worker processes,
+    along with a dictionary that maps the process id of each worker to (rows it parsed, seconds it spent).
+
+    The rows of the recipe file are split into byte ranges that end on row boundaries, one or more per worker,
+    and every worker reads and cleans its ranges on its own. The results are joined in file order.
+    """
+    from concurrent.futures import ProcessPoolExecutor  # imported here since it pulls in multiprocessing
+    workers = workers or os.cpu_count() or 1
+    boundaries = row_boundaries(uncleaned, workers * 4)
+
+    cleaned_csv = []
+    worker_stats = {}
+    with ProcessPoolExecutor(workers, initializer=_init_clean_worker, initargs=(ingredients, prices)) as pool:
+        chunks = [pool.submit(_clean_chunk, uncleaned, start, end, lazy)
+                  for start, end in zip(boundaries, boundaries[1:])]
+        for chunk in chunks:
+            rows, pid, parsed, seconds = chunk.result()
+            cleaned_csv.extend(rows)
+            previous = worker_stats.get(pid, (0, 0.0))
+            worker_stats[pid] = (previous[0] + parsed, previous[1] + seconds)
+
+    if proj2stats.enabled():
+        _count_cleaned(sum(parsed for parsed, _ in worker_stats.values()), len(cleaned_csv),
+                       sum(len(lst[5]) for lst in cleaned_csv))
+    return cleaned_csv, worker_stats
+
+
+def row_boundaries(uncleaned: str, chunks: int) -> list[int]:
+    """Return byte offsets in the csv file uncleaned that split the rows after its header into at most chunks ranges
+    of about the same size. The first offset is the start of the first row and the last is the end of the file.
+
+    Quoted fields can contain newlines, so a newline only ends a row if an even number of quote characters
+    come before it.
+    """
+    if os.path.getsize(uncleaned) == 0:
+        return [0]
+
+    with open(uncleaned, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = len(data)
+        boundaries = []
+        position, quotes = 0, 0  # quotes is the number of quote characters in data[:position]
+        for target in [0] + [size * k // chunks for k in range(1, chunks)]:
+            if target > position:
+                quotes += data[position:target].count(b'"')
+                position = target
+            newline = data.find(b'\n', position)
+            while newline != -1:
+                quotes += data[position:newline].count(b'"')
+                position = newline
+                if quotes % 2 == 0:
                     break
-                recipeprice += prices[item]
+                newline = data.find(b'\n', newline + 1)
+            if newline == -1:
+                break
+            position = newline + 1
+            if not boundaries or position > boundaries[-1]:
+                boundaries.append(position)
+        if not boundaries or boundaries[-1] < size:
+            boundaries.append(size)
+    return boundaries
 
-            if include:
-                lst.append(ingredients)
-                lst.append(round(recipeprice, 2))
-                cleaned_csv.append(lst)
-    return cleaned_csv
 
+_clean_worker_state = {}
 
-def to_recipe_class(cleaned_csv: list) -> list:  # takes the cleaned_csv and adds each element to the Recipe class
-    """Return a list of Recipe objects from cleaned recipe csv"""
-    recipes = []
-    for i in range(1, len(cleaned_csv)):
-        recipe = Recipe(cleaned_csv[i])
-        recipes.append(recipe)
-    return recipes
 
+def _init_clean_worker(ingredients: str, prices: dict) -> None:
+    """Compile the ingredient matcher once in a worker process started by cleancsv_parallel."""
+    _clean_worker_state['matcher'] = IngredientMatcher(get_food(ingredients))
+    _clean_worker_state['prices'] = prices
 
-def get_ingredients(foods: list, uncleaned_foods: list) -> list:
+
+def _clean_chunk(uncleaned: str, start: int, end: int, lazy: bool = False) -> tuple[list, int, int, float]:
+    """Clean the rows between byte offsets start and end of the csv file uncleaned, in a worker process.
+    If lazy is True, the rows are for lazy recipes, as in cleancsv.
+
+    Return the cleaned rows, the process id, the number of rows parsed and the seconds taken.
+    """
+    started = time.perf_counter()
+    with open(uncleaned, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    rows = []
+    parsed = 0
+    if lazy:
+        for offset, row in _read_rows(data, 0, len(data)):
+            parsed += 1
+            lst = clean_row(row, _clean_worker_state['matcher'], _clean_worker_state['prices'])
+            if lst is not None:
+                rows.append(_without_text(lst, start + offset))
+        return rows, os.getpid(), parsed, time.perf_counter() - started
+
+    # newline=None translates line endings the same way opening the file in text mode does
+    for row in csv.reader(io.StringIO(data.decode('utf-8'), newline=None)):
+        parsed += 1
+        lst = clean_row(row, _clean_worker_state['matcher'], _clean_worker_state['prices'])
+        if lst is not None:
+            rows.append(lst)
+    return rows, os.getpid(), parsed, time.perf_counter() - started
+
+
+@proj2stats.timed('to_recipe_class')
+def to_recipe_class(cleaned_csv: list, text: Optional[RecipeText] = None, skip_first_row: bool = True) -> list:
+    """Return a list of Recipe objects from cleaned recipe csv. If text is given, the rows are lazy (see cleancsv)
+    and so are the recipes, which read their text with text. See iter_recipes for skip_first_row.
+    """
+    return list(iter_recipes(cleaned_csv, text, skip_first_row))
+
+
+def iter_recipes(cleaned_rows: Iterable[list], text: Optional[RecipeText] = None,
+                 skip_first_row: bool = True) -> Iterator[Recipe]:
+    """Yield a Recipe for each of cleaned_rows as it is needed, like to_recipe_class.
+
+    to_recipe_class has always left out the first cleaned row (the header is already skipped by cleancsv, so
+    that is the first recipe), and so does this by default, so graphs keep the recipes they have always had.
+    If skip_first_row is False, every row is used.
+    """
+    rows = iter(cleaned_rows)
+    if skip_first_row:
+        next(rows, None)
+    for row in rows:
+        yield Recipe(row, text)
+
+
+def _row_end(data: Any, start: int, end: int) -> int:
+    """Return the offset just after the newline that ends the csv row that starts at offset start of data, or end if
+    there is no such newline before end. A newline inside a quoted field does not end a row.
+    """
+    position, quotes = start, 0
+    while True:
+        newline = data.find(b'\n', position, end)
+        if newline == -1:
+            return end
+        quotes += data[position:newline].count(b'"')
+        if quotes % 2 == 0:
+            return newline + 1
+        position = newline + 1
+
+
+def _read_rows(data: Any, start: int, end: int) -> Iterator[tuple[int, list]]:
+    """Yield the byte offset and the fields of every csv row in data (bytes or a memory map of a utf-8 file)
+    between offsets start and end, which must be row boundaries.
+
+    >>> data = b'a,"b\\nc"\\r\\nd,e\\n'
+    >>> list(_read_rows(data, 0, len(data)))
+    [(0, ['a', 'b\\nc']), (9, ['d', 'e'])]
+    """
+    position = start
+    while position < end:
+        row_end = _row_end(data, position, end)
+        # newline=None translates line endings the same way opening the file in text mode does
+        for row in csv.reader(io.StringIO(data[position:row_end].decode('utf-8'), newline=None)):
+            yield position, row
+        position = row_end
+
+
+def get_ingredients(foods: list | IngredientMatcher, uncleaned_foods: list) -> list:
     """Return a cleaned list of ingredients from a list of unprocessed ingredient descriptions.
-    This function takes in food (a list of ingredient names) and uncleaned_foods (a list of uncleaned
-    instructions from a recipe). It processes each the words, and returns a cleaned version of ingredients
+    This function takes in food (a list of ingredient names, or an IngredientMatcher already compiled from one)
+    and uncleaned_foods (a list of uncleaned instructions from a recipe). It processes each the words, and returns
+    a cleaned version of ingredients
 
     >>> foods = ['potato', 'egg', 'salt']
     >>> lst = ['2 large egg whites', '1 pound new potatoes (about 1 inch in diameter)', '2 teaspoons kosher salt']
     >>> get_ingredients(foods, lst)
     ['egg', 'potato', 'salt']
     """
-    cleaned_ingredients = []
+    if isinstance(foods, IngredientMatcher):
+        return foods.match(uncleaned_foods)
+    return IngredientMatcher(foods).match(uncleaned_foods)
+
+
+class IngredientMatcher:
+    """A matcher compiled from a list of ingredient names, used to find those ingredients in recipe text.
+
+    Every name is split into words that are normalized the same way as recipe text (see normalize_word) and
+    stored in a token trie, so multi-word names like 'rye bread' can be matched, and each line of a recipe
+    is matched in one left-to-right pass with a dictionary lookup per word. When names overlap, the longest one
+    wins, so '1 slice rye bread' gives 'rye bread' rather than 'bread'.
+
+    >>> matcher = IngredientMatcher(['egg', 'bread', 'rye bread'])
+    >>> matcher.match(['2 Eggs, beaten', '1 slice rye bread', 'bread crumbs', '1 egg yolk'])
+    ['egg', 'rye bread', 'bread']
+    """
+    # Private Instance Attributes:
+    #     - _trie:
+    #         Nested dictionaries keyed by normalized words. The ingredient name that ends at a node
+    #         is stored under the key '' (normalized words are never empty).
+    _trie: dict
+
+    def __init__(self, foods: list) -> None:
+        """Compile a matcher for the given ingredient names."""
+        self._trie = {}
+        for food in foods:
+            words = [normalize_word(word) for word in food.split()]
+            words = [word for word in words if word]
+            if words:
+                node = self._trie
+                for word in words:
+                    node = node.setdefault(word, {})
+                node.setdefault('', food)  # the first spelling of a name is the one that is kept
+
+    def match(self, uncleaned_foods: list) -> list:
+        """Return the ingredients found in uncleaned_foods, in the order they first appear, without duplicates."""
+        found = {}
+        for line in uncleaned_foods:
+            words = [word for word in map(normalize_word, line.split()) if word]
+            start = 0
+            while start < len(words):
+                node = self._trie.get(words[start])
+                match, end = None, start + 1
+                position = start + 1
+                while node is not None:
+                    if '' in node:
+                        match, end = node[''], position
+                    if position == len(words):
+                        break
+                    node = node.get(words[position])
+                    position += 1
+
+                if match is not None:
+                    found.setdefault(match)
+                start = end
+
+        return list(found)
+
+
+class IngredientLexicon:
+    """An index of ingredient names for checking and completing what a user types.
+
+    Names are looked up by their normalized words (see normalize_word), so 'Eggs' and 'rye breads' find 'egg'
+    and 'rye bread' with one dictionary lookup. A trie of the characters of the names gives the completions of
+    what has been typed so far, and an index of the three letter sequences in every normalized name gives the
+    names within a small edit distance of a typo. Every name has a weight (like its number of recipes), and
+    heavier names come first.
+
+    >>> lexicon = IngredientLexicon({'egg': 40, 'eggplant': 3, 'bread': 20, 'rye bread': 5})
+    >>> lexicon.lookup('Eggs'), lexicon.lookup('rye breads'), lexicon.lookup('toast')
+    ('egg', 'rye bread', None)
+    >>> lexicon.complete('eg')
+    ['egg', 'eggplant']
+    >>> lexicon.suggest('bred')
+    ['bread']
+
+    Instance Attributes:
+        - completions: the most completions that complete returns
+    """
+    completions: int
+    # Private Instance Attributes:
+    #     - _names:
+    #         Maps the normalized form of every name (see lexicon_key) to the name.
+    #     - _weights:
+    #         Maps every name to its weight.
+    #     - _prefixes:
+    #         Nested dictionaries keyed by the characters of the names in lower case. The best completions of
+    #         the characters that lead to a node are stored under the key '' (characters are never empty). A
+    #         node with at most completions names below it has no children, and its list holds all of them.
+    #     - _keys:
+    #         The keys of _names, in the order _grams refers to them.
+    #     - _grams:
+    #         Maps every three letter sequence (see _trigrams) to the positions in _keys of the keys that
+    #         contain it.
+    _names: dict[str, str]
+    _weights: dict[str, int]
+    _prefixes: dict
+    _keys: list[str]
+    _grams: dict[str, list[int]]
+
+    def __init__(self, weights: dict[str, int], completions: int = 10) -> None:
+        """Index the names in weights, which maps each of them to its weight."""
+        self.completions = completions
+        self._weights = weights
+        self._names = {}
+        for name in sorted(weights, key=self._rank):
+            key = lexicon_key(name)
+            if key and key not in self._names:  # the heaviest name with a key is the one it finds
+                self._names[key] = name
+
+        self._keys = list(self._names)
+        self._grams = {}
+        for position, key in enumerate(self._keys):
+            for gram in set(_trigrams(key)):
+                self._grams.setdefault(gram, []).append(position)
+
+        names = sorted((name.lower(), name) for name in weights)
+        self._prefixes = self._prefix_node([lowered for lowered, _ in names], [name for _, name in names],
+                                           0, len(names), 0)
+
+    def _rank(self, name: str) -> tuple[int, str]:
+        """Return the key that orders names heaviest first, then alphabetically."""
+        return -self._weights[name], name
+
+    def _prefix_node(self, lowered: list[str], names: list[str], start: int, end: int, depth: int) -> dict:
+        """Return the trie node of the names[start:end], which all share their first depth characters when
+        lowered (lowered holds the lower case names, sorted).
+        """
+        node = {'': heapq.nsmallest(self.completions, names[start:end], key=self._rank)}
+        if end - start <= self.completions:
+            return node
+        i = start
+        while i < end:
+            if len(lowered[i]) == depth:  # this name ends here, and is only in this node's list
+                i += 1
+                continue
+            prefix = lowered[i][:depth + 1]
+            j = bisect.bisect_left(lowered, prefix[:-1] + chr(ord(prefix[-1]) + 1), i, end)
+            node[prefix[-1]] = self._prefix_node(lowered, names, i, j, depth + 1)
+            i = j
+        return node
+
+    def lookup(self, text: str) -> Optional[str]:
+        """Return the name that text means, ignoring case, plurals and anything that is not a letter, or None if
+        there is none.
+        """
+        return self._names.get(lexicon_key(text))
+
+    def complete(self, prefix: str, limit: Optional[int] = None) -> list[str]:
+        """Return the best names (at most limit, and at most completions) that start with prefix, ignoring case."""
+        prefix = prefix.lower().lstrip()
+        if not prefix:
+            return []
+        node = self._prefixes
+        for character in prefix:
+            if character in node:
+                node = node[character]
+            elif len(node) == 1:  # every name below node is in its list
+                return [name for name in node[''] if name.lower().startswith(prefix)][:limit]
+            else:
+                return []
+        return node[''][:limit]
+
+    def suggest(self, text: str, limit: int = 5, max_distance: Optional[int] = None) -> list[str]:
+        """Return the names (at most limit) whose normalized form is within max_distance edits of the normalized
+        form of text, closest first. If max_distance is None, it is 1 for words of up to 4 letters and 2
+        otherwise.
+
+        Only the names that share enough three letter sequences with text to be that close are compared with it.
+        """
+        key = lexicon_key(text)
+        if not key:
+            return []
+        if max_distance is None:
+            max_distance = 1 if len(key) <= 4 else 2
+        grams = set(_trigrams(key))
+        shared = collections.Counter(itertools.chain.from_iterable(self._grams.get(gram, ()) for gram in grams))
+        needed = max(1, len(grams) - 3 * max_distance)  # one edit changes at most 3 of the sequences
+
+        found = []
+        for position, count in shared.items():
+            other = self._keys[position]
+            if count >= needed and abs(len(other) - len(key)) <= max_distance:
+                distance = edit_distance(key, other)
+                if distance <= max_distance:
+                    name = self._names[other]
+                    found.append((distance, -self._weights[name], name))
+        return [name for _, _, name in heapq.nsmallest(limit, found)]
+
+
+def lexicon_key(text: str) -> str:
+    """Return the words of text normalized by normalize_word, joined by spaces, which is how IngredientLexicon
+    compares names.
+
+    >>> lexicon_key('  Rye Breads ')
+    'rye bread'
+    """
+    return ' '.join(word for word in map(normalize_word, text.split()) if word)
+
+
+def _trigrams(key: str) -> list[str]:
+    """Return the three letter sequences of key with a '$' added to each end, so a key of n letters has n of them."""
+    padded = '$' + key + '$'
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
 
-    for x in uncleaned_foods:
-        words = x.split()  # get words into a list
-        for f in words:
-            cleaned_word = ''.join(c for c in f if c.isalpha())  # make sure its only letters
-            if cleaned_word:
-                cleaned_word = singularize(cleaned_word)  # make sure it's not empty
-                if cleaned_word in foods and cleaned_word not in cleaned_ingredients:
-                    cleaned_ingredients.append(cleaned_word)
+def edit_distance(a: str, b: str) -> int:
+    """Return the number of single character insertions, deletions and substitutions that turn a into b.
 
-    return cleaned_ingredients
+    >>> edit_distance('potatos', 'potato'), edit_distance('rosemry', 'rosemary'), edit_distance('egg', 'egg')
+    (1, 1, 0)
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_word(word: str) -> str:
+    """Return word with every non-letter removed, in lower case and singularized.
+    Return an empty string if word has no letters.
+
+    >>> normalize_word('Potatoes,')
+    'potato'
+    >>> normalize_word('(1/2)')
+    ''
+    """
+    cleaned_word = ''.join(c for c in word if c.isalpha()).lower()  # make sure its only letters
+    if cleaned_word:
+        cleaned_word = singularize(cleaned_word)  # make sure it's not empty
+    return cleaned_word
 
 
 def singularize(word: str) -> str:
@@ -158,6 +709,7 @@ def singularize(word: str) -> str:
     return word
 
 
+@proj2stats.timed('pricestodict')
 def pricestodict(prices: str) -> dict:
     """takes the ingredient_prices csv and turns it into a dictionary
 
@@ -180,21 +732,140 @@ def pricestodict(prices: str) -> dict:
 
 def reviews_to_dict() -> dict[str: float]:
     """Takes the review csv and outputs a dictionary that gives it's average rating score per each recipe"""
-    reviewdictlong = {}
-    reviews = 'reviews.csv'
+    return get_review_store().averages()
 
-    with open(reviews, 'r') as file:
-        reader = csv.reader(file)
-        next(reader)
+
+class ReviewStore:
+    """The ratings from a reviews csv file, aggregated in memory as a running sum and count per recipe.
+
+    The file is read in full only once. After that, refresh reads just the rows appended since the last read
+    (whether they were written by save_review or by another process), starting at the byte offset where the
+    last read stopped. If the file shrinks or is replaced, it is read again from the start.
+
+    Objects that keep something derived from the ratings can listen for changes with add_listener.
+
+    >>> store = ReviewStore('reviews.csv')
+    >>> store.average("Newton's Law")
+    4.5
+    >>> store.average('Not a recipe') is None
+    True
+    """
+    # Private Instance Attributes:
+    #     - _path:
+    #         The path of the reviews csv file.
+    #     - _totals:
+    #         Maps a recipe title to [sum of its ratings, number of ratings].
+    #     - _offset:
+    #         The byte offset in the file up to which rows have been read.
+    #     - _identity:
+    #         The (device, inode) of the file when it was last read, or None if it has not been read yet.
+    #     - _lock:
+    #         Held while the totals are changed, so a review saved from another thread is counted once.
+    #     - _listeners:
+    #         The objects told about every change to the average ratings. They are held weakly, so listening
+    #         does not keep them alive.
+    _path: str
+    _totals: dict[str, list]
+    _offset: int
+    _identity: Optional[tuple[int, int]]
+    _lock: threading.RLock
+    _listeners: weakref.WeakSet
+
+    def __init__(self, path: str) -> None:
+        """Initialize a store for the reviews csv file at path and read the file."""
+        self._path = path
+        self._totals = {}
+        self._offset = 0
+        self._identity = None
+        self._lock = threading.RLock()
+        self._listeners = weakref.WeakSet()
+        self.refresh()
+
+    def add_listener(self, listener: Any) -> None:
+        """Call listener.reviews_changed(titles) after every refresh that changes the average rating of any
+        recipe, with the set of their titles. It is called with the totals locked, so it sees them as they are
+        after the refresh.
+        """
+        with self._lock:
+            self._listeners.add(listener)
+
+    @proj2stats.timed('ReviewStore.refresh')
+    def refresh(self) -> None:
+        """Read any complete rows that have been appended to the reviews file since it was last read."""
+        with self._lock:
+            changed = self._refresh()
+            if changed:
+                for listener in list(self._listeners):
+                    listener.reviews_changed(changed)
+
+    def _refresh(self) -> set[str]:
+        """Do the work of refresh, with the lock held, and return the titles whose average rating may have changed."""
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            changed = set(self._totals)
+            self._totals, self._offset, self._identity = {}, 0, None
+            return changed
+
+        changed = set()
+        if stat.st_size < self._offset or (stat.st_dev, stat.st_ino) != self._identity:
+            changed.update(self._totals)
+            self._totals, self._offset = {}, 0
+        self._identity = (stat.st_dev, stat.st_ino)
+        if stat.st_size == self._offset:
+            return changed
+
+        with open(self._path, 'rb') as file:
+            file.seek(self._offset)
+            data = file.read()
+        end = data.rfind(b'\n') + 1  # a row without its newline may still be being written
+        if end == 0:
+            return changed
+
+        reader = csv.reader(io.StringIO(data[:end].decode('utf-8')))
+        if self._offset == 0:
+            next(reader, None)
         for row in reader:
-            if row[0] not in reviewdictlong:
-                reviewdictlong[row[0]] = [float(row[1]), 1]
-            else:
-                reviewdictlong[row[0]][0] += float(row[1])
-                reviewdictlong[row[0]][1] += 1
+            if len(row) >= 2:
+                self._add(row[0], float(row[1]))
+                changed.add(row[0])
+        self._offset += end
+        return changed
+
+    def _add(self, recipe: str, rating: float) -> None:
+        """Add one rating of recipe to the running totals."""
+        if recipe not in self._totals:
+            self._totals[recipe] = [rating, 1]
+        else:
+            self._totals[recipe][0] += rating
+            self._totals[recipe][1] += 1
+
+    def average(self, recipe: str) -> Optional[float]:
+        """Return the average rating of recipe, or None if it has no reviews."""
+        if recipe in self._totals:
+            return self._totals[recipe][0] / self._totals[recipe][1]
+        return None
 
-    reviewdict = {item: reviewdictlong[item][0] / reviewdictlong[item][1] for item in reviewdictlong}
-    return reviewdict
+    def averages(self) -> dict[str, float]:
+        """Return a dictionary that maps each reviewed recipe to its average rating."""
+        with self._lock:
+            return {item: self._totals[item][0] / self._totals[item][1] for item in self._totals}
+
+
+_review_stores = {}
+
+
+def get_review_store(reviews: str = 'reviews.csv') -> ReviewStore:
+    """Return the shared ReviewStore for the given reviews csv file, brought up to date with the file.
+
+    The file is only read in full the first time a store is requested for it.
+    """
+    key = os.path.abspath(reviews)
+    if key not in _review_stores:
+        _review_stores[key] = ReviewStore(reviews)
+    else:
+        _review_stores[key].refresh()
+    return _review_stores[key]
 
 
 class _Vertex:
@@ -211,8 +882,13 @@ class _Vertex:
     - v_cleaned_ingredients: a list containing ingredients of the given recipe.
                              If kind is 'ingredient', this will be None.
     - price: A float representing the price of this vertex
+    - vertex_id: The integer id of this vertex in its graph, or -1 if it is not in a graph.
     - neighbours: The vertices that are adjacent to this vertex.
 
+    Vertices use __slots__ rather than a __dict__. The neighbours of a vertex are normally kept in a set of its
+    own, but once its graph is compacted (see Graph.compact) they are read from the graph's shared
+    _Adjacency arrays instead, and neighbours returns a read-only frozenset.
+
     Representation Invariants:
         - self.item != ""
         - self.kind != ""
@@ -229,14 +905,24 @@ class _Vertex:
     details: Optional[Recipe]
     v_cleaned_ingredients: Optional[list[str]]
     price: float
+    vertex_id: int
     neighbours: set[_Vertex]
+    # Private Instance Attributes:
+    #     - _neighbours:
+    #         The set of neighbours of this vertex, or None while they are stored in _adjacency.
+    #     - _adjacency:
+    #         The compact neighbour arrays of this vertex's graph, or None if it has not been compacted.
+    _neighbours: Optional[set[_Vertex]]
+    _adjacency: Optional[_Adjacency]
+    __slots__ = ('item', 'kind', 'details', 'v_cleaned_ingredients', 'price', 'vertex_id',
+                 '_neighbours', '_adjacency')
 
     def __repr__(self):
         """Return a string representation of the _Vertex instance."""
         return f"_Vertex({self.item}, kind={self.kind})"
 
     def __init__(self, item: str, details: Optional[Recipe],
-                 v_cleaned_ingredients: Optional[list[str]], kind: str, price: float) -> None:
+                 v_cleaned_ingredients: Optional[list[str]], kind: str, price: float, vertex_id: int = -1) -> None:
         """Initialize a new vertex with the given item, kind, and cleaned ingredients.
 
         Each vertex is either a recipe or ingredient.
@@ -251,7 +937,34 @@ class _Vertex:
         self.details = details
         self.v_cleaned_ingredients = v_cleaned_ingredients
         self.price = price
-        self.neighbours = set()
+        self.vertex_id = vertex_id
+        self._neighbours = set()
+        self._adjacency = None
+
+    @property
+    def neighbours(self) -> set[_Vertex]:
+        """The vertices that are adjacent to this vertex."""
+        if self._adjacency is not None:
+            return self._adjacency.neighbours_of(self.vertex_id)
+        return self._neighbours
+
+    def use_adjacency(self, adjacency: Optional[_Adjacency]) -> None:
+        """Read the neighbours of this vertex from adjacency from now on, or if adjacency is None, go back to
+        keeping them in a set of its own.
+        """
+        if adjacency is None:
+            self._neighbours = set(self.neighbours)
+        else:
+            self._neighbours = None
+        self._adjacency = adjacency
+
+    def iter_neighbours(self) -> Iterator[_Vertex]:
+        """Return an iterator over the neighbours of this vertex. Unlike neighbours, this builds no new set when
+        the neighbours are stored in an _Adjacency, so loops that only go through them once should use it.
+        """
+        if self._adjacency is not None:
+            return self._adjacency.iter_neighbours(self.vertex_id)
+        return iter(self._neighbours)
 
     def depth(self) -> int:
         """Returns depth of the vertex
@@ -262,7 +975,9 @@ class _Vertex:
         >>> v1.depth()
         1
         """
-        return len(self.neighbours)
+        if self._adjacency is not None:
+            return self._adjacency.degree(self.vertex_id)
+        return len(self._neighbours)
 
     def similarity(self, other: _Vertex) -> float:
         """Calculates how similar this vertex is to another by comparing the number of shared
@@ -316,6 +1031,368 @@ class _Vertex:
         return len(intersectset)
 
 
+class _Adjacency:
+    """The edges of a compacted graph, stored in compressed sparse row form.
+
+    The neighbours of the vertex with id i are the vertices whose ids are in
+    targets[offsets[i]:offsets[i + 1]]. Each id takes 4 bytes, instead of a set entry per edge end.
+
+    Instance Attributes:
+    - vertices: Every vertex of the graph, indexed by vertex id.
+    - offsets: The start of each vertex's ids in targets, plus the length of targets at the end.
+    - targets: The ids of the neighbours of every vertex, one vertex after another.
+    """
+    __slots__ = ('vertices', 'offsets', 'targets')
+    vertices: list[_Vertex]
+    offsets: array.array
+    targets: array.array
+
+    def __init__(self, vertices: list[_Vertex]) -> None:
+        """Initialize the compact form of the neighbours of vertices, which are indexed by vertex id."""
+        self.vertices = vertices
+        self.offsets = array.array('I', [0])
+        self.targets = array.array('I')
+        for vertex in vertices:
+            self.targets.extend(sorted(u.vertex_id for u in vertex.neighbours))
+            self.offsets.append(len(self.targets))
+
+    def neighbours_of(self, vertex_id: int) -> frozenset[_Vertex]:
+        """Return the neighbours of the vertex with the given id."""
+        vertices = self.vertices
+        return frozenset(vertices[i] for i in self.targets[self.offsets[vertex_id]:self.offsets[vertex_id + 1]])
+
+    def iter_neighbours(self, vertex_id: int) -> Iterator[_Vertex]:
+        """Yield the neighbours of the vertex with the given id, without collecting them into a set."""
+        vertices = self.vertices
+        for i in self.targets[self.offsets[vertex_id]:self.offsets[vertex_id + 1]]:
+            yield vertices[i]
+
+    def degree(self, vertex_id: int) -> int:
+        """Return the number of neighbours of the vertex with the given id."""
+        return self.offsets[vertex_id + 1] - self.offsets[vertex_id]
+
+
+class _ViewVertex(_Vertex):
+    """An ingredient vertex as a GraphView shows it: the same as the vertex of the graph, except that its
+    neighbours are only the recipes of the view that use it, so its depth is the number of those recipes.
+
+    Its neighbours are a read-only frozenset, and its price is always the current price of the graph's vertex.
+
+    Instance Attributes:
+    - vertex: The vertex of the graph that this vertex shows.
+
+    >>> g = Graph()
+    >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a'], 0.0]), {'a': 1})
+    >>> g.add_vertex(Recipe(['r2', [], '', '', '', ['a'], 0.0]), {'a': 1})
+    >>> g.add_edge('r1')
+    >>> g.add_edge('r2')
+    >>> shown = _ViewVertex(g.get_item('a'), frozenset([g.get_item('r2')]))
+    >>> shown, shown.depth(), g.get_item('a').depth()
+    (_Vertex(a, kind=ingredient), 1, 2)
+    """
+    vertex: _Vertex
+    __slots__ = ('vertex',)
+
+    def __init__(self, vertex: _Vertex, neighbours: frozenset[_Vertex]) -> None:
+        """Initialize a vertex that shows vertex with only the given neighbours."""
+        self.vertex = vertex
+        self.item = vertex.item
+        self.kind = vertex.kind
+        self.details = None
+        self.v_cleaned_ingredients = None
+        self.vertex_id = vertex.vertex_id
+        self._neighbours = neighbours
+        self._adjacency = None
+
+    @property
+    def price(self) -> float:
+        """The price of the ingredient, read from the vertex of the graph."""
+        return self.vertex.price
+
+
+class _DegreeCube:
+    """The number of recipes that use each ingredient, precomputed for every combination of price limit and
+    review limit that option 2 asks about, so the most common ingredients under those limits can be looked up
+    instead of counted.
+
+    Recipes are split into price bands by the price quantiles of the graph's recipes, and into rating levels:
+    the level of a recipe is the largest whole review limit (1 to 5) it passes, or 0 if it is not reviewed or
+    passes none. For every rating level and price band the cube keeps, per ingredient, how many recipes of at
+    least that level and in that band or a cheaper one use it. A price limit that falls inside a band is
+    answered from the nearer edge of the band, adding or taking away the few recipes of the band between that
+    edge and the limit.
+
+    The cube listens to its ReviewStore, so when a review changes a recipe's level, the recipe's ingredients are
+    moved between levels straight away.
+
+    Instance Attributes:
+    - store: The ReviewStore that the rating levels come from.
+    - names: The names of the ingredients, indexed by ingredient index.
+    - recipe_ingredients: The ingredient indexes of each recipe, indexed by recipe id (the same ids as in the
+      graph).
+    - recipe_prices: The price of each recipe, indexed by recipe id.
+    - levels: The rating level of each recipe, indexed by recipe id.
+    - thresholds: The highest price in each band, in increasing order.
+    - bands: The band of each recipe, indexed by recipe id.
+    - band_recipes: The recipe ids in each band, in increasing order of price.
+    - band_prices: The prices of the recipes in band_recipes, in the same order.
+    - counts: counts[level][band][i] is the number of recipes with at least that rating level and a price of at
+      most thresholds[band] that use the ingredient with index i.
+    """
+    store: ReviewStore
+    names: list[str]
+    recipe_ingredients: list[tuple[int, ...]]
+    recipe_prices: list[float]
+    levels: list[int]
+    thresholds: list[float]
+    bands: list[int]
+    band_recipes: list[list[int]]
+    band_prices: list[list[float]]
+    counts: list[list[array.array]]
+    _lock: threading.Lock
+    _titles: dict[str, int]
+
+    def __init__(self, graph: Graph, store: ReviewStore, max_bands: int = 128) -> None:
+        """Initialize the cube of graph with at most max_bands price bands, and start listening to store."""
+        self.store = store
+        self._lock = threading.Lock()
+        self.names = [vertex.item for vertex in graph.filter_kind('ingredient')]
+        indexes = {name: i for i, name in enumerate(self.names)}
+        recipes = graph.filter_kind('recipe')
+        self._titles = {recipe.item: recipe_id for recipe_id, recipe in enumerate(recipes)}
+        self.recipe_ingredients = [tuple(indexes[u.item] for u in recipe.neighbours) for recipe in recipes]
+        self.recipe_prices = [recipe.price for recipe in recipes]
+        self.levels = [_rating_level(store.average(recipe.item)) for recipe in recipes]
+
+        by_price = sorted(range(len(recipes)), key=self.recipe_prices.__getitem__)
+        quantiles = {self.recipe_prices[by_price[(i + 1) * len(by_price) // max_bands - 1]]
+                     for i in range(max_bands) if (i + 1) * len(by_price) // max_bands > 0}
+        self.thresholds = sorted(quantiles)
+        self.bands = [bisect.bisect_left(self.thresholds, price) for price in self.recipe_prices]
+        self.band_recipes = [[] for _ in self.thresholds]
+        for recipe_id in by_price:
+            self.band_recipes[self.bands[recipe_id]].append(recipe_id)
+        self.band_prices = [[self.recipe_prices[recipe_id] for recipe_id in band] for band in self.band_recipes]
+
+        # count each (level, band) on its own, then add them up over higher levels and cheaper bands
+        empty = array.array('I', bytes(4 * len(self.names)))
+        cells = [[array.array('I', empty) for _ in self.thresholds] for _ in range(6)]
+        for recipe_id, ingredients in enumerate(self.recipe_ingredients):
+            cell = cells[self.levels[recipe_id]][self.bands[recipe_id]]
+            for i in ingredients:
+                cell[i] += 1
+        self.counts = [[] for _ in range(6)]
+        at_least = [empty for _ in self.thresholds]
+        for level in range(5, -1, -1):
+            at_least = [array.array('I', map(operator.add, at_least[band], cells[level][band]))
+                        for band in range(len(self.thresholds))]
+            total = empty
+            for band in range(len(self.thresholds)):
+                total = array.array('I', map(operator.add, total, at_least[band]))
+                self.counts[level].append(total)
+        store.add_listener(self)
+
+    def top(self, k: int, pricelimit: Optional[float], level: int) -> list[tuple[int, int]]:
+        """Return the (number of recipes, ingredient index) pairs of the k ingredients used by the most recipes
+        that cost at most pricelimit (if it is not None) and have at least the given rating level, most first.
+        Ties are broken by the larger name, and ingredients used by no such recipe are left out.
+        """
+        with self._lock:
+            band = len(self.thresholds) if pricelimit is None else bisect.bisect_left(self.thresholds, pricelimit)
+            if band == len(self.thresholds):
+                counts = self.counts[level][-1] if self.thresholds else []
+            else:
+                prices = self.band_prices[band]
+                split = bisect.bisect_right(prices, pricelimit)
+                if split <= len(prices) - split:  # closer to the cheaper edge of the band
+                    counts = array.array('I', self.counts[level][band - 1]) if band else \
+                        array.array('I', bytes(4 * len(self.names)))
+                    self._add_recipes(counts, self.band_recipes[band][:split], level, 1)
+                else:
+                    counts = array.array('I', self.counts[level][band])
+                    self._add_recipes(counts, self.band_recipes[band][split:], level, -1)
+        top = heapq.nlargest(k, zip(counts, self.names, range(len(self.names))))
+        return [(count, i) for count, _, i in top if count > 0]
+
+    def reprice(self, recipe_id: int, price: float) -> bool:
+        """Move the recipe with the given id to the band of its new price, and return True.
+
+        Return False, without changing anything, if the price is above every band, in which case the cube has
+        to be built again.
+        """
+        with self._lock:
+            old_band, new_band = self.bands[recipe_id], bisect.bisect_left(self.thresholds, price)
+            if new_band == len(self.thresholds):
+                return False
+            old_price = self.recipe_prices[recipe_id]
+            position = bisect.bisect_left(self.band_prices[old_band], old_price)
+            position = self.band_recipes[old_band].index(recipe_id, position)
+            del self.band_recipes[old_band][position]
+            del self.band_prices[old_band][position]
+            position = bisect.bisect_right(self.band_prices[new_band], price)
+            self.band_recipes[new_band].insert(position, recipe_id)
+            self.band_prices[new_band].insert(position, price)
+            self.recipe_prices[recipe_id] = price
+            self.bands[recipe_id] = new_band
+
+            # the recipe leaves (or joins) the cumulative counts of the bands between its old and new band
+            sign = -1 if new_band > old_band else 1
+            for level in range(self.levels[recipe_id] + 1):
+                for band in range(min(old_band, new_band), max(old_band, new_band)):
+                    counts = self.counts[level][band]
+                    for i in self.recipe_ingredients[recipe_id]:
+                        counts[i] += sign
+            return True
+
+    def _add_recipes(self, counts: array.array, recipe_ids: list[int], level: int, sign: int) -> None:
+        """Add sign to the count in counts of every ingredient of the given recipes that have at least level."""
+        levels = self.levels
+        recipe_ingredients = self.recipe_ingredients
+        for recipe_id in recipe_ids:
+            if levels[recipe_id] >= level:
+                for i in recipe_ingredients[recipe_id]:
+                    counts[i] += sign
+
+    def reviews_changed(self, titles: set[str]) -> None:
+        """Move the recipes with the given titles to the rating level of their new average rating."""
+        with self._lock:
+            for title in titles:
+                if title not in self._titles:
+                    continue
+                recipe_id = self._titles[title]
+                old, new = self.levels[recipe_id], _rating_level(self.store.average(title))
+                if old == new:
+                    continue
+                sign = 1 if new > old else -1
+                self.levels[recipe_id] = new
+                for level in range(min(old, new) + 1, max(old, new) + 1):
+                    for band in range(self.bands[recipe_id], len(self.thresholds)):
+                        counts = self.counts[level][band]
+                        for i in self.recipe_ingredients[recipe_id]:
+                            counts[i] += sign
+
+
+def _rating_level(average: Optional[float]) -> int:
+    """Return the largest whole review limit from 1 to 5 that a recipe with the given average rating passes, or 0
+    if it has no rating or passes none.
+
+    >>> [_rating_level(average) for average in [None, 0.5, 1.0, 3.99, 4.0, 6.0]]
+    [0, 0, 1, 3, 4, 5]
+    """
+    if average is None or average < 1:
+        return 0
+    return min(int(average), 5)
+
+
+class _RatingIndex:
+    """The recipes of a graph bucketed by rating level (see _rating_level), kept up to date with a ReviewStore.
+
+    Instance Attributes:
+    - store: The ReviewStore that the ratings come from.
+    - titles: The title of each recipe, indexed by recipe id.
+    - levels: The rating level of each recipe, indexed by recipe id.
+    - buckets: buckets[level] is the set of ids of the recipes with that rating level.
+    """
+    store: ReviewStore
+    titles: list[str]
+    levels: list[int]
+    buckets: list[set[int]]
+    _recipe_ids: dict[str, int]
+    _lock: threading.Lock
+
+    def __init__(self, recipes: list[_Vertex], store: ReviewStore) -> None:
+        """Initialize the index of recipes, which are indexed by recipe id, and start listening to store."""
+        self.store = store
+        self._lock = threading.Lock()
+        self.titles = [recipe.item for recipe in recipes]
+        self._recipe_ids = {title: recipe_id for recipe_id, title in enumerate(self.titles)}
+        self.levels = [_rating_level(store.average(title)) for title in self.titles]
+        self.buckets = [set() for _ in range(6)]
+        for recipe_id, level in enumerate(self.levels):
+            self.buckets[level].add(recipe_id)
+        store.add_listener(self)
+
+    def count_at_least(self, level: int) -> int:
+        """Return the number of recipes with at least the given rating level."""
+        return sum(len(bucket) for bucket in self.buckets[level:])
+
+    def recipes_at_least(self, level: int) -> list[int]:
+        """Return the ids of the recipes with at least the given rating level."""
+        with self._lock:
+            return [recipe_id for bucket in self.buckets[level:] for recipe_id in bucket]
+
+    def passes(self, recipe_id: int, reviewlimit: float) -> bool:
+        """Return whether the recipe with the given id has an average rating of at least reviewlimit."""
+        if reviewlimit in (1, 2, 3, 4, 5):
+            return self.levels[recipe_id] >= reviewlimit
+        average = self.store.average(self.titles[recipe_id])
+        return average is not None and average >= reviewlimit
+
+    def reviews_changed(self, titles: set[str]) -> None:
+        """Move the recipes with the given titles to the bucket of their new average rating."""
+        with self._lock:
+            for title in titles:
+                if title in self._recipe_ids:
+                    recipe_id = self._recipe_ids[title]
+                    level = _rating_level(self.store.average(title))
+                    self.buckets[self.levels[recipe_id]].discard(recipe_id)
+                    self.buckets[level].add(recipe_id)
+                    self.levels[recipe_id] = level
+
+
+class _IngredientBitsets:
+    """The ingredients of every recipe of a graph as a bitset: a Python int with one bit for each ingredient of
+    the graph. Checking whether a recipe uses all of, none of, or nothing but a set of ingredients is then one
+    AND of two ints, instead of a walk over the recipe's neighbours.
+
+    The most used ingredients get the lowest bits, so most recipes' bitsets stay a few machine words long.
+
+    Instance Attributes:
+    - bits: Maps each ingredient to its bit.
+    - masks: The bitset of the ingredients of each recipe, indexed by recipe id.
+
+    >>> g = Graph()
+    >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b'], 0.0]), {'a': 1, 'b': 1})
+    >>> g.add_vertex(Recipe(['r2', [], '', '', '', ['a'], 0.0]), {'a': 1})
+    >>> g.add_edge('r1')
+    >>> g.add_edge('r2')
+    >>> bitsets = _IngredientBitsets(g._recipes)
+    >>> bitsets.bits
+    {'a': 0, 'b': 1}
+    >>> bitsets.masks
+    [3, 1]
+    """
+    bits: dict[str, int]
+    masks: list[int]
+
+    def __init__(self, recipes: list[_Vertex]) -> None:
+        """Initialize the bitsets of recipes, which are indexed by recipe id."""
+        uses = {}
+        for recipe in recipes:
+            for ingredient in recipe.iter_neighbours():
+                uses[ingredient.item] = uses.get(ingredient.item, 0) + 1
+        order = sorted(uses, key=lambda item: (-uses[item], item))
+        self.bits = {ingredient: bit for bit, ingredient in enumerate(order)}
+        self.masks = [self.mask(ingredient.item for ingredient in recipe.iter_neighbours()) for recipe in recipes]
+
+    def mask(self, ingredients: Iterable[str]) -> int:
+        """Return the bitset of ingredients, leaving out the ones that no recipe uses."""
+        bits = self.bits
+        mask = 0
+        for ingredient in ingredients:
+            if ingredient in bits:
+                mask |= 1 << bits[ingredient]
+        return mask
+
+    def matching(self, recipe_ids: Iterable[int], required: int, forbidden: int) -> list[int]:
+        """Return the recipe_ids of the recipes that use every ingredient in the bitset required and none in the
+        bitset forbidden, in the same order.
+        """
+        masks = self.masks
+        return [recipe_id for recipe_id in recipe_ids
+                if masks[recipe_id] & required == required and not masks[recipe_id] & forbidden]
+
+
 class Graph:
     """A graph used to represent a recipes and ingredients network.
     """
@@ -323,11 +1400,68 @@ class Graph:
     #     - _vertices:
     #         A collection of the vertices contained in this graph.
     #         Maps item to _Vertex object.
+    #     - _recipes:
+    #         The recipe vertices of this graph, in insertion order. A recipe's position in
+    #         this list is its recipe id.
+    #     - _recipe_ids:
+    #         Maps a recipe title to its recipe id.
+    #     - _postings:
+    #         An inverted index that maps each ingredient to the ids of the recipes that
+    #         use it, in increasing order.
+    #     - _cooccurrence:
+    #         Maps each ingredient to a dictionary from every other ingredient it shares a recipe with to the
+    #         number of recipes they share. It is kept up to date as recipes are added and removed.
+    #     - _similar:
+    #         Maps ingredients to their top 5 (similarity score, ingredient) pairs, as returned by get_similar.
+    #         Emptied whenever an edge changes.
+    #     - _ingredient_order:
+    #         Every ingredient, largest name first (the order get_similar breaks ties in), or None if it has to
+    #         be recomputed.
+    #     - _adjacency:
+    #         The shared neighbour arrays of the vertices if this graph has been compacted, otherwise None.
+    #     - _cube:
+    #         The recipe counts of every ingredient under each price and review limit (see top_ingredients), or
+    #         None if it has to be recomputed.
+    #     - _price_index:
+    #         The prices of the recipes in increasing order, and the ids of those recipes in the same order, or
+    #         None if it has to be recomputed.
+    #     - _ratings:
+    #         The recipes bucketed by rating, or None if it has to be recomputed.
+    #     - _lexicon:
+    #         The ingredients weighted by their number of recipes (see lexicon), or None if it has to be
+    #         recomputed.
+    #     - _bitsets:
+    #         The ingredients of every recipe as a bitset (see filter_recipes), or None if they have to be
+    #         recomputed.
     _vertices: dict[str, _Vertex]
+    _recipes: list[_Vertex]
+    _recipe_ids: dict[str, int]
+    _postings: dict[str, list[int]]
+    _cooccurrence: dict[str, dict[str, int]]
+    _similar: dict[str, list[tuple[float, str]]]
+    _ingredient_order: Optional[list[str]]
+    _adjacency: Optional[_Adjacency]
+    _cube: Optional[_DegreeCube]
+    _price_index: Optional[tuple[list[float], list[int]]]
+    _ratings: Optional[_RatingIndex]
+    _lexicon: Optional[IngredientLexicon]
+    _bitsets: Optional[_IngredientBitsets]
 
     def __init__(self) -> None:
         """Initialize an empty graph (no vertices or edges)."""
         self._vertices = {}
+        self._recipes = []
+        self._recipe_ids = {}
+        self._postings = {}
+        self._cooccurrence = {}
+        self._similar = {}
+        self._ingredient_order = None
+        self._adjacency = None
+        self._cube = None
+        self._price_index = None
+        self._ratings = None
+        self._lexicon = None
+        self._bitsets = None
 
     def is_empty(self) -> bool:
         """Returns True if this Graph is empty"""
@@ -345,16 +1479,34 @@ class Graph:
         >>> g.is_empty()
         False
         """
-        for ingredient in recipe.cleaned_ingredients:
-            price = float(prices[ingredient])
-            if ingredient not in self._vertices:  # adds a vertex for each ingredient in the recipe
-                self._vertices[ingredient] = _Vertex(ingredient, details=None, v_cleaned_ingredients=None,
-                                                     kind="ingredient", price=price)
+        for ingredient in recipe.cleaned_ingredients:  # adds a vertex for each ingredient in the recipe
+            self.add_ingredient(ingredient, float(prices[ingredient]))
 
         if recipe.title not in self._vertices:  # adds a vertex for the recipe
+            self._expand()
             self._vertices[recipe.title] = _Vertex(recipe.title, details=recipe,
                                                    v_cleaned_ingredients=recipe.cleaned_ingredients,
-                                                   kind="recipe", price=recipe.price)
+                                                   kind="recipe", price=recipe.price, vertex_id=len(self._vertices))
+            self._recipe_ids[recipe.title] = len(self._recipes)
+            self._recipes.append(self._vertices[recipe.title])
+            self._price_index, self._ratings, self._bitsets = None, None, None
+
+    def add_ingredient(self, ingredient: str, price: float) -> None:
+        """Add a new vertex representing the given ingredient to the graph, with no neighbours.
+
+        Do nothing if the given ingredient is already in this graph.
+
+        >>> g = Graph()
+        >>> g.add_ingredient('salt', 1.99)
+        >>> g.get_item('salt')
+        _Vertex(salt, kind=ingredient)
+        """
+        if ingredient not in self._vertices:
+            self._expand()
+            self._vertices[ingredient] = _Vertex(ingredient, details=None, v_cleaned_ingredients=None,
+                                                 kind="ingredient", price=price, vertex_id=len(self._vertices))
+            self._similar, self._ingredient_order, self._cube, self._lexicon = {}, None, None, None
+            self._bitsets = None
 
     def add_edge(self, recipe: str) -> None:
         """Add an edge between the recipe and every ingredient in it.
@@ -366,13 +1518,181 @@ class Graph:
         """
         v1 = self._vertices[recipe]
         if recipe in self._vertices and v1.kind == "recipe":
+            self._expand()
+            recipe_id = self._recipe_ids[recipe]
+            old = [v2.item for v2 in v1.neighbours]
+            new = []
             for ingredient in v1.v_cleaned_ingredients:  # loop though each ingredient
                 v2 = self._vertices[ingredient]
-                v1.neighbours.add(v2)
-                v2.neighbours.add(v1)
+                if v2 not in v1.neighbours:  # keeps the posting lists free of duplicates
+                    v1.neighbours.add(v2)
+                    v2.neighbours.add(v1)
+                    self._postings.setdefault(ingredient, []).append(recipe_id)
+                    new.append(ingredient)
+            if new:
+                self._count_pairs(old, new)
+                self._similar, self._cube, self._lexicon, self._bitsets = {}, None, None, None
         else:
             raise ValueError("One or both vertices do not exist.")
 
+    @proj2stats.timed('Graph.update_prices')
+    def update_prices(self, new_prices: dict) -> list[str]:
+        """Change the prices of the ingredients to the ones in new_prices (a dictionary like pricestodict returns)
+        and reprice only the recipes that use an ingredient whose price changed. Return the titles of the recipes
+        whose price was recomputed.
+
+        A recipe's price is the sum of its ingredients' prices, in the order of its cleaned ingredients and
+        rounded to cents, as cleancsv computes it, so a recipe ends up with the same price as if the graph were
+        loaded again with the new prices. This is the product of the recipe-by-ingredient incidence matrix with
+        the vector of ingredient prices, worked out only for the rows that change: the posting list of each
+        changed ingredient says which recipes those are. The price index and the cube that top_ingredients uses
+        are updated to match.
+
+        Ingredients that are not in new_prices, or have no price there, keep their current price.
+
+        >>> g = Graph()
+        >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b'], 3.0]), {'a': 1, 'b': 2})
+        >>> g.add_vertex(Recipe(['r2', [], '', '', '', ['b'], 2.0]), {'b': 2})
+        >>> g.add_vertex(Recipe(['r3', [], '', '', '', ['c'], 5.0]), {'c': 5})
+        >>> for title in ['r1', 'r2', 'r3']:
+        ...     g.add_edge(title)
+        >>> g.update_prices({'a': 1, 'b': 2.5, 'c': ''})
+        ['r1', 'r2']
+        >>> g.get_item('r1').price, g.get_item('r1').details.price, g.get_item('b').price
+        (3.5, 3.5, 2.5)
+        """
+        changed = []
+        for ingredient, price in new_prices.items():
+            vertex = self._vertices.get(ingredient)
+            if vertex is not None and vertex.kind == 'ingredient' and price != '' and float(price) != vertex.price:
+                vertex.price = float(price)
+                changed.append(ingredient)
+        if not changed:
+            return []
+
+        recipe_ids = sorted({recipe_id for ingredient in changed for recipe_id in self._postings.get(ingredient, ())})
+        many = len(recipe_ids) * 4 > len(self._recipes)
+        if many:  # the indexes are quicker to build again than to update one recipe at a time
+            self._price_index, self._cube = None, None
+        for recipe_id in recipe_ids:
+            recipe = self._recipes[recipe_id]
+            old_price = recipe.price
+            new_price = round(sum(self._vertices[ingredient].price for ingredient in recipe.v_cleaned_ingredients), 2)
+            recipe.price = new_price
+            recipe.details.price = new_price
+            if old_price != new_price and not many:
+                self._move_in_price_index(recipe_id, old_price, new_price)
+                if self._cube is not None and not self._cube.reprice(recipe_id, new_price):
+                    self._cube = None
+        return [self._recipes[recipe_id].item for recipe_id in recipe_ids]
+
+    def _move_in_price_index(self, recipe_id: int, old_price: float, new_price: float) -> None:
+        """Move the recipe with the given id from old_price to new_price in the price index, if there is one."""
+        if self._price_index is not None:
+            recipe_prices, by_price = self._price_index
+            start = bisect.bisect_left(recipe_prices, old_price)
+            position = by_price.index(recipe_id, start, bisect.bisect_right(recipe_prices, old_price))
+            del recipe_prices[position]
+            del by_price[position]
+            position = bisect.bisect_right(recipe_prices, new_price)
+            recipe_prices.insert(position, new_price)
+            by_price.insert(position, recipe_id)
+
+    def _count_pairs(self, old: list[str], new: list[str]) -> None:
+        """Add one to the co-occurrence count of every pair of ingredients that now share a recipe, after the
+        ingredients in new were added to a recipe that already had the ingredients in old.
+        """
+        cooccurrence = self._cooccurrence
+        everything = old + new
+        for ingredient in new:
+            row = cooccurrence.setdefault(ingredient, {})
+            for other in everything:
+                if other != ingredient:
+                    row[other] = row.get(other, 0) + 1
+        for ingredient in old:
+            row = cooccurrence[ingredient]
+            for other in new:
+                row[other] = row.get(other, 0) + 1
+
+    @proj2stats.timed('Graph.remove_recipe')
+    def remove_recipe(self, recipe: str) -> None:
+        """Remove the recipe and its edges from this graph. Its ingredients stay in the graph.
+
+        The co-occurrence counts only change for the pairs of ingredients in the recipe, but the recipes added
+        after it are renumbered, which takes time proportional to the size of the graph.
+
+        Raise a ValueError if recipe is not a recipe in this graph.
+
+        >>> g = Graph()
+        >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b'], 0.0]), {'a': 1, 'b': 1})
+        >>> g.add_vertex(Recipe(['r2', [], '', '', '', ['a', 'b', 'c'], 0.0]), {'a': 1, 'b': 1, 'c': 1})
+        >>> g.add_edge('r1')
+        >>> g.add_edge('r2')
+        >>> g.remove_recipe('r1')
+        >>> g.shared_neighbours('a', 'b'), g.check_exist('r1'), g.get_item('a').depth()
+        (1, False, 1)
+        """
+        if recipe not in self._vertices or self._vertices[recipe].kind != "recipe":
+            raise ValueError(recipe + " is not a recipe in this graph.")
+        self._expand()
+        v1 = self._vertices.pop(recipe)
+        recipe_id = self._recipe_ids.pop(recipe)
+
+        ingredients = {v2.item for v2 in v1.neighbours}
+        for v2 in v1.neighbours:
+            v2.neighbours.discard(v1)
+            row = self._cooccurrence[v2.item]
+            for other in ingredients:
+                if other != v2.item:
+                    row[other] -= 1
+                    if row[other] == 0:
+                        del row[other]
+        v1.neighbours.clear()
+
+        del self._recipes[recipe_id]
+        for later_id in range(recipe_id, len(self._recipes)):
+            self._recipe_ids[self._recipes[later_id].item] = later_id
+        for ingredient, recipe_ids in self._postings.items():
+            position = bisect.bisect_left(recipe_ids, recipe_id)
+            if ingredient in ingredients:
+                del recipe_ids[position]
+            for i in range(position, len(recipe_ids)):
+                recipe_ids[i] -= 1
+        for vertex_id, vertex in enumerate(self._vertices.values()):
+            vertex.vertex_id = vertex_id
+        v1.vertex_id = -1
+        self._similar, self._cube, self._price_index, self._ratings, self._lexicon = {}, None, None, None, None
+        self._bitsets = None
+
+    def compact(self) -> None:
+        """Switch this graph to its compact storage mode, which holds the same vertices and edges in less memory.
+
+        The neighbours of every vertex move out of per-vertex sets into one pair of arrays indexed by vertex id
+        (see _Adjacency), and the posting lists become arrays of 4 byte ids. Reading the graph works the same
+        afterwards. Adding to it switches it back to the normal mode first.
+
+        >>> g = Graph()
+        >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b'], 0.0]), {'a': 1, 'b': 1})
+        >>> g.add_edge('r1')
+        >>> g.compact()
+        >>> sorted(vertex.item for vertex in g.get_item('a').neighbours)
+        ['r1']
+        """
+        if self._adjacency is None:
+            self._adjacency = _Adjacency(list(self._vertices.values()))
+            for vertex in self._vertices.values():
+                vertex.use_adjacency(self._adjacency)
+            self._postings = {ingredient: array.array('I', recipe_ids)
+                              for ingredient, recipe_ids in self._postings.items()}
+
+    def _expand(self) -> None:
+        """Switch this graph back from its compact storage mode, if it is in it, so it can be changed."""
+        if self._adjacency is not None:
+            for vertex in self._vertices.values():
+                vertex.use_adjacency(None)
+            self._adjacency = None
+            self._postings = {ingredient: list(recipe_ids) for ingredient, recipe_ids in self._postings.items()}
+
     def check_exist(self, item: str) -> bool:
         """Check if this item exists inside the graph, return True if it does.
 
@@ -414,6 +1734,7 @@ class Graph:
 
         Note that this method is provided for you, and you shouldn't change it.
         """
+        import networkx as nx
         graph_nx = nx.Graph()
         for v in self._vertices.values():
             graph_nx.add_node(v.item, kind=v.kind)
@@ -455,10 +1776,72 @@ class Graph:
         depth_scores = depth_scores[:10]
         return depth_scores[:10]
 
+    @proj2stats.timed('Graph.top_ingredients')
+    def top_ingredients(self, k: int = 10, pricelimit: Optional[float] = None,
+                        reviewlimit: Optional[float] = None) -> list[tuple[int, str, float]]:
+        """Return the k ingredients used by the most recipes that cost at most pricelimit and have an average rating
+        of at least reviewlimit, as (number of recipes, ingredient, price) tuples, most first. Either limit can be
+        None for no limit.
+
+        This gives the same answer as get_most_connected_ingredients on the GraphView that filter_recipes returns
+        for all recipes (for k = 10), but for a whole number review limit from 1 to 5 it is looked up in a
+        _DegreeCube that is built the first time it is needed, instead of counted over every matching recipe.
+
+        >>> my_graph = load_graph('food_small copy.csv', 'ingredients copy.csv', 'ingredient_prices.csv')
+        >>> every = my_graph.filter_recipes(14000, [], {}, 20.0, None)
+        >>> my_graph.top_ingredients(10, 20.0, None) == every.get_most_connected_ingredients()
+        True
+        """
+        reviews = get_review_store()
+        if reviewlimit is not None and reviewlimit not in (1, 2, 3, 4, 5):
+            degrees = {}
+            for recipe in self._recipes:
+                average = reviews.average(recipe.item)
+                if (pricelimit is None or recipe.price <= pricelimit) and average is not None \
+                        and average >= reviewlimit:
+                    for ingredient in recipe.iter_neighbours():
+                        degrees[ingredient.item] = degrees.get(ingredient.item, 0) + 1
+            return heapq.nlargest(k, ((depth, item, self._vertices[item].price) for item, depth in degrees.items()))
+
+        if self._cube is None or self._cube.store is not reviews:
+            self._cube = _DegreeCube(self, reviews)
+        names = self._cube.names
+        return [(count, names[i], self._vertices[names[i]].price)
+                for count, i in self._cube.top(k, pricelimit, 0 if reviewlimit is None else int(reviewlimit))]
+
+    @proj2stats.timed('Graph.filter_recipes')
     def filter_recipes(self, limit: int, user_input: list, prices: dict, pricelimit: Optional[float],
-                       reviewlimit: Optional[int]) -> Graph:
+                       reviewlimit: Optional[int], required: Optional[list] = None, excluded: Optional[list] = None,
+                       pantry: bool = False, rank: str = 'matches') -> GraphView:
         """Return a list that contains the best matched recipes based on the users input (that is ingredients that they
-        have) and based on the number of recipes wanted. If there are no matches, return a string tell them so.
+        have) and based on the number of recipes wanted. The matches are returned as a GraphView over this graph,
+        so no vertices are copied however many recipes are wanted. If there are no matches, the view is empty.
+
+        The query starts from whichever of its conditions lets through the fewest recipes, and checks the others
+        on just those recipes. Each condition has an index that says how many recipes pass it without looking at
+        them: the posting lists of the ingredients in user_input, the recipes sorted by price, and the recipes
+        bucketed by rating (see _RatingIndex). So a narrow query like "under $10, rated at least 4" only touches
+        the recipes that qualify (target: under a millisecond at 100k recipes for typical pantry queries).
+
+        A recipe's score is the number of ingredients in user_input that it uses, and only recipes that use at
+        least one are matched (every recipe is, with a score of 1, if user_input is empty). The best limit
+        recipes are picked with a heap rather than by sorting every match. Ties are broken by recipe id, which
+        gives the same ranking as scanning the recipes in insertion order.
+
+        Recipes can also be limited by which ingredients they use: they must use every ingredient in required
+        and none in excluded, and if pantry is True, nothing but the ingredients in user_input (the recipes that
+        can be made entirely from what the user has). These are checked against the ingredient bitset of each
+        recipe (see _IngredientBitsets), one AND per recipe, after the posting lists have picked the candidates.
+
+        rank says how the matches are ordered:
+            - 'matches': most ingredients in user_input used first (the score above)
+            - 'cost': cheapest to complete first, that is the lowest total price of the ingredients the recipe
+              uses that are not in user_input, then the highest coverage
+            - 'coverage': highest coverage first, that is the largest share of the recipe's ingredients that are
+              in user_input, then the cheapest to complete
+        Both of the last two come from one pass over the posting lists of user_input (see _covered).
+
+        prices is no longer used, and is only kept so that existing calls still work.
 
         Preconditions:
             - user_input != []
@@ -472,97 +1855,503 @@ class Graph:
         >>> g2 = my_graph.filter_recipes( 1, ['dog', 'cat', 'welcent', 'alden'], prices, None, None)
         >>> g2.filter_kind('recipe')
         []
+
+        >>> pantry = ['potato', 'rosemary', 'egg', 'parsley', 'salt', 'pepper', 'thyme']
+        >>> my_graph.filter_recipes(10, pantry, prices, None, None, pantry=True).filter_kind('recipe')
+        [_Vertex(Crispy Salt and Pepper Potatoes, kind=recipe)]
+        >>> my_graph.filter_recipes(10, ['butter'], prices, None, None, excluded=['lemon']).filter_kind('recipe')
+        [_Vertex(Italian Sausage and Bread Stuffing, kind=recipe), _Vertex(Newton's Law, kind=recipe)]
+        >>> cheapest = my_graph.filter_recipes(3, ['apple', 'lemon juice'], prices, None, None, rank='cost')
+        >>> [recipe.item for recipe in cheapest.filter_kind('recipe')]
+        ['Apples and Oranges', 'Warm Comfort', "Newton's Law"]
+        >>> no_lemon = my_graph.filter_recipes(10, ['butter'], prices, None, None, excluded=['lemon'], rank='cost')
+        >>> [recipe.item for recipe in no_lemon.filter_kind('recipe')]
+        ["Newton's Law", 'Italian Sausage and Bread Stuffing']
+        >>> my_graph.filter_recipes(10, pantry, prices, None, None, pantry=True, rank='cost').filter_kind('recipe')
+        [_Vertex(Crispy Salt and Pepper Potatoes, kind=recipe)]
         """
-        reviews = reviews_to_dict()
-        recipe = self.filter_kind('recipe')
+        if rank not in ('matches', 'cost', 'coverage'):
+            raise ValueError("Unknown ranking: " + repr(rank))
+        bitsets = None
+        if required or excluded or pantry:
+            bitsets = self._get_bitsets()
+            if required and any(item not in bitsets.bits for item in required):
+                return GraphView([])  # no recipe uses it
+            required_bits = bitsets.mask(required or ())
+            forbidden_bits = bitsets.mask(excluded or ())
+            if pantry:
+                forbidden_bits |= ~bitsets.mask(user_input)
+
+        # estimate how many recipes pass each condition, and start from the one that fewest pass
+        plans = []
+        if user_input:
+            plans.append((sum(len(self._postings.get(item, ())) for item in user_input), 'ingredients'))
+        if required:
+            rarest = min(required, key=lambda item: len(self._postings[item]))
+            plans.append((len(self._postings[rarest]), 'required'))
+        if pricelimit is not None:
+            recipe_prices, by_price = self._get_price_index()
+            cheap = bisect.bisect_right(recipe_prices, pricelimit)
+            plans.append((cheap, 'price'))
+        if reviewlimit is not None:
+            ratings = self._get_ratings()
+            lowest = min(max(math.floor(reviewlimit), 0), 5)
+            plans.append((ratings.count_at_least(lowest), 'rating'))
+        start = min(plans)[1] if plans else None
 
         poss_recipes = {}
-
-        if user_input:
-            for i in recipe:
-                for item in user_input:
-                    if item in [x.item for x in i.neighbours]:
-                        if i.item not in poss_recipes:
-                            poss_recipes[i.item] = 1
-                        else:
-                            poss_recipes[i.item] = 1 + poss_recipes[i.item]
+        covered = None
+        if start == 'ingredients' and rank != 'matches':  # the pass that ranks by cost also finds the matches
+            covered = self._covered(user_input)
+            poss_recipes = {recipe_id: covered[0][recipe_id] for item in user_input
+                            for recipe_id in self._postings.get(item, ())}
+        elif start == 'ingredients':
+            for item in user_input:
+                for recipe_id in self._postings.get(item, []):
+                    poss_recipes[recipe_id] = poss_recipes.get(recipe_id, 0) + 1
+        if start == 'ingredients' and bitsets is not None:
+            poss_recipes = {recipe_id: poss_recipes[recipe_id]
+                            for recipe_id in bitsets.matching(poss_recipes, required_bits, forbidden_bits)}
         else:
-            for i in recipe:
-                poss_recipes[i.item] = 1
-
-        sorted_by_values = dict(sorted(poss_recipes.items(), key=lambda thing: thing[1], reverse=True))
+            if start == 'price':
+                candidates = by_price[:cheap]
+            elif start == 'rating':
+                candidates = ratings.recipes_at_least(lowest)
+            elif start == 'required':
+                candidates = self._postings[rarest]
+            else:
+                candidates = range(len(self._recipes))
+            if bitsets is not None:
+                candidates = bitsets.matching(candidates, required_bits, forbidden_bits)
+            if user_input:
+                wanted = {}
+                for item in user_input:
+                    wanted[item] = wanted.get(item, 0) + 1
+                for recipe_id in candidates:
+                    score = sum(wanted.get(ingredient.item, 0)
+                                for ingredient in self._recipes[recipe_id].iter_neighbours())
+                    if score:
+                        poss_recipes[recipe_id] = score
+            else:
+                poss_recipes = dict.fromkeys(candidates, 1)
 
+        proj2stats.count('filter_recipes.candidates_scored', len(poss_recipes))
         final_recipes = []
-        if pricelimit is not None:
-            for recipe in sorted_by_values:
-                if sorted_by_values[recipe] > 0 and self._vertices[recipe].price <= pricelimit:
-                    final_recipes.append(recipe)
+        for recipe_id in poss_recipes:
+            if start != 'price' and pricelimit is not None and self._recipes[recipe_id].price > pricelimit:
+                continue
+            if reviewlimit is not None and not ratings.passes(recipe_id, reviewlimit):
+                continue
+            final_recipes.append(recipe_id)
+
+        if rank == 'matches':
+            keys = {recipe_id: (-poss_recipes[recipe_id], recipe_id) for recipe_id in final_recipes}
         else:
-            for recipe in sorted_by_values:
-                if sorted_by_values[recipe] > 0:
-                    final_recipes.append(recipe)
-
-        if reviewlimit is not None:
-            final_recipes = [obj for obj in final_recipes if (obj in reviews) and (reviews[obj] >= reviewlimit)]
+            counts, totals = covered if covered is not None else self._covered(user_input)
+            recipes = self._recipes
+
+            def missing(recipe_id: int) -> float:
+                """Return the price of the ingredients of the recipe with the given id that are not in user_input."""
+                return max(round(recipes[recipe_id].price - totals[recipe_id], 2), 0.0)
+
+            def uncovered(recipe_id: int) -> float:
+                """Return minus the share of the ingredients of the recipe with the given id that are in user_input."""
+                return -counts[recipe_id] / (recipes[recipe_id].depth() or 1)
+
+            first, second = (missing, uncovered) if rank == 'cost' else (uncovered, missing)
+            scores = {recipe_id: first(recipe_id) for recipe_id in final_recipes}
+            if scores:  # only recipes that score at least as well as the limit-th best can be among the best
+                cutoff = heapq.nsmallest(limit, scores.values())[-1]
+                final_recipes = [recipe_id for recipe_id in final_recipes if scores[recipe_id] <= cutoff]
+            keys = {recipe_id: (scores[recipe_id], second(recipe_id), recipe_id) for recipe_id in final_recipes}
+        best = heapq.nsmallest(limit, final_recipes, key=keys.__getitem__)
+        return GraphView([self._recipes[recipe_id] for recipe_id in best])
+
+    def _covered(self, user_input: list) -> tuple[list[int], list[float]]:
+        """Return how many of the different ingredients in user_input each recipe uses, and their total price, both
+        indexed by recipe id.
+
+        This is the product of the recipe-by-ingredient incidence matrix with a vector of ones and with the
+        vector of prices of the ingredients in user_input, worked out in one pass over their posting lists, so
+        the recipes that use none of them are never looked at.
+        """
+        counts, totals = [0] * len(self._recipes), [0.0] * len(self._recipes)
+        for item in dict.fromkeys(user_input):
+            if item in self._postings:
+                price = self._vertices[item].price
+                for recipe_id in self._postings[item]:
+                    counts[recipe_id] += 1
+                    totals[recipe_id] += price
+        return counts, totals
+
+    def missing_ingredients(self, recipe: str, user_input: list) -> tuple[float, list[str]]:
+        """Return what is left to buy to make recipe with the ingredients in user_input: the total price of the
+        ingredients of recipe that are not in user_input (the cost that filter_recipes ranks by), and those
+        ingredients in order of name.
 
-        if len(final_recipes) < limit:
-            limit = len(final_recipes)
+        >>> g = Graph()
+        >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b', 'c'], 6.5]), {'a': 1, 'b': 2, 'c': 3.5})
+        >>> g.add_edge('r1')
+        >>> g.missing_ingredients('r1', ['a', 'z'])
+        (5.5, ['b', 'c'])
+        """
+        vertex = self._vertices[recipe]
+        have = set(user_input)
+        covered = sum(ingredient.price for ingredient in vertex.neighbours if ingredient.item in have)
+        missing = sorted(ingredient.item for ingredient in vertex.neighbours if ingredient.item not in have)
+        return max(round(vertex.price - covered, 2), 0.0), missing
+
+    def _get_price_index(self) -> tuple[list[float], list[int]]:
+        """Return the prices of the recipes in increasing order and the ids of those recipes in the same order,
+        computing them first if needed.
+        """
+        if self._price_index is None:
+            by_price = sorted(range(len(self._recipes)), key=lambda recipe_id: self._recipes[recipe_id].price)
+            self._price_index = ([self._recipes[recipe_id].price for recipe_id in by_price], by_price)
+        return self._price_index
+
+    def _get_ratings(self) -> _RatingIndex:
+        """Return the rating index of the recipes, up to date with the reviews file, computing it first if needed."""
+        reviews = get_review_store()
+        if self._ratings is None or self._ratings.store is not reviews:
+            self._ratings = _RatingIndex(self._recipes, reviews)
+        return self._ratings
+
+    def _get_bitsets(self) -> _IngredientBitsets:
+        """Return the ingredient bitsets of the recipes, computing them first if needed."""
+        if self._bitsets is None:
+            self._bitsets = _IngredientBitsets(self._recipes)
+        return self._bitsets
+
+    def lexicon(self) -> IngredientLexicon:
+        """Return a lexicon of the ingredients in this graph, weighted by their number of recipes, for looking up,
+        completing and correcting ingredient names that users type. It is built the first time it is needed.
 
-        if not final_recipes:
-            return Graph()
-        else:
-            filtered_graph = Graph()
-            for i in range(0, limit):
-                curr_vertex = self._vertices[final_recipes[i]]
-                filtered_graph.add_vertex(curr_vertex.details, prices)
-                filtered_graph.add_edge(curr_vertex.details.title)
-            return filtered_graph
+        >>> my_graph = load_graph('food_small copy.csv', 'ingredients copy.csv', 'ingredient_prices.csv')
+        >>> my_graph.lexicon().lookup('Potatoes'), my_graph.lexicon().suggest('rosemry')
+        ('potato', ['rosemary'])
+        """
+        if self._lexicon is None:
+            self._lexicon = IngredientLexicon({vertex.item: vertex.depth()
+                                               for vertex in self.filter_kind('ingredient')})
+        return self._lexicon
 
     def get_similar(self, ingredient: str) -> list:
-        """Gets similar ingredients by using the _Vertex method 'similar.' Returns a list of at
+        """Gets similar ingredients, scored the same way as the _Vertex method 'similarity.' Returns a list of at
         most, 5 ingredients.
+
+        The scores are worked out from the co-occurrence counts, so only the ingredients that share a recipe
+        with ingredient are looked at. The answer is kept until the graph changes.
+
+        >>> g = Graph()
+        >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b', 'c'], 0.0]), {'a': 1, 'b': 1, 'c': 1})
+        >>> g.add_vertex(Recipe(['r2', [], '', '', '', ['a', 'b'], 0.0]), {'a': 1, 'b': 1})
+        >>> g.add_edge('r1')
+        >>> g.add_edge('r2')
+        >>> g.get_similar('a')
+        [(1.0, 'b'), (0.5, 'c')]
         """
-        scores = []
-        target = self.get_item(ingredient)
-        ingredients = [item.item for item in self.filter_kind('ingredient')]
-        ingredients.remove(ingredient)
+        if ingredient not in self._vertices or self._vertices[ingredient].kind != 'ingredient':
+            raise ValueError(ingredient + " is not an ingredient in this graph.")
+        if ingredient not in self._similar:
+            shared_counts = self._cooccurrence.get(ingredient, {})
+            degrees = {other: self._vertices[other].depth() for other in shared_counts}
+            degrees[ingredient] = self._vertices[ingredient].depth()
+            if self._ingredient_order is None:
+                self._ingredient_order = sorted((vertex.item for vertex in self.filter_kind('ingredient')),
+                                                reverse=True)
+            self._similar[ingredient] = _top_similar(ingredient, shared_counts, degrees, self._ingredient_order)
+        return list(self._similar[ingredient])
+
+    @proj2stats.timed('Graph.get_pairings')
+    def get_pairings(self, ingredient: str) -> list[tuple[float, str, int]]:
+        """Return the (similarity score, ingredient, number of shared recipes) of the at most 5 ingredients that
+        appear most with ingredient, as option 3 shows them.
+
+        These are the answers get_similar and shared_neighbours give on the GraphView of every recipe that uses
+        ingredient: within those recipes, another ingredient's score is the fraction of them it appears in. They
+        are read straight from the co-occurrence counts, without building the view. An ingredient that is in no
+        recipe has no pairings.
+
+        >>> g = Graph()
+        >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b', 'c'], 0.0]), {'a': 1, 'b': 1, 'c': 1})
+        >>> g.add_vertex(Recipe(['r2', [], '', '', '', ['a', 'b'], 0.0]), {'a': 1, 'b': 1})
+        >>> g.add_edge('r1')
+        >>> g.add_edge('r2')
+        >>> g.get_pairings('a')
+        [(1.0, 'b', 2), (0.5, 'c', 1)]
+        """
+        if ingredient not in self._vertices or self._vertices[ingredient].kind != 'ingredient':
+            raise ValueError(ingredient + " is not an ingredient in this graph.")
+        degree = self._vertices[ingredient].depth()
+        shared_counts = self._cooccurrence.get(ingredient, {})
+        best = heapq.nlargest(5, ((round(shared / degree, 2), other) for other, shared in shared_counts.items()))
+        return [(score, other, shared_counts[other]) for score, other in best]
+
+    def shared_neighbours(self, ingredient1: str, ingredient2: str) -> int:
+        """Return the number of recipes in this graph that use both ingredient1 and ingredient2.
+
+        >>> g = Graph()
+        >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b', 'c'], 0.0]), {'a': 1, 'b': 1, 'c': 1})
+        >>> g.add_edge('r1')
+        >>> g.shared_neighbours('a', 'c')
+        1
+        """
+        if ingredient1 == ingredient2 and ingredient1 in self._vertices:
+            return self._vertices[ingredient1].depth()
+        return self._cooccurrence.get(ingredient1, {}).get(ingredient2, 0)
+
+
+def _top_similar(ingredient: str, shared_counts: dict[str, int], degrees: dict[str, int],
+                 names: list[str]) -> list[tuple[float, str]]:
+    """Return the top 5 (similarity score, ingredient) pairs for ingredient, in the order get_similar gives them.
 
-        for other in ingredients:
-            score = target.similarity(self.get_item(other))
-            scores.append((score, other))
+    The score of two ingredients is the Jaccard similarity of their recipes, shared / (degree1 + degree2 -
+    shared), rounded like _Vertex.similarity. Ties are broken by the larger name, as in sorting the pairs in
+    reverse. Ingredients that share no recipe score 0.0, so they only make the top 5 when fewer than 5
+    ingredients score more.
 
-        scores.sort(reverse=True)
+    shared_counts maps the other ingredients that share recipes with ingredient to how many they share, degrees
+    maps ingredient and those ingredients to their number of recipes, and names holds every ingredient in
+    reverse order.
+    """
+    degree = degrees[ingredient]
+    scores = [(round(shared / (degree + degrees[other] - shared), 2), other)
+              for other, shared in shared_counts.items()]
+    unrelated = []
+    for other in names:
+        if len(unrelated) == 5:
+            break
+        if other != ingredient and other not in shared_counts:
+            unrelated.append((0.0, other))
+    return heapq.nlargest(5, scores + unrelated)
+
+
+class GraphView:
+    """A read-only view of some of the recipes of a Graph, along with their ingredients, as returned by
+    Graph.filter_recipes.
+
+    A view holds references to the vertices of the graph it came from instead of copies, but it behaves like
+    a Graph built from just the selected recipes: an ingredient's only neighbours inside the view are the
+    selected recipes that use it, and the vertices are ordered as add_vertex would have added them. Its recipes
+    are the graph's own vertices (all their ingredients are in the view), and its ingredients are _ViewVertex
+    objects, so their neighbours and depth are counted inside the view too.
+
+    >>> g = Graph()
+    >>> g.add_vertex(Recipe(['r1', [], '', '', '', ['a', 'b'], 0.0]), {'a': 1, 'b': 1})
+    >>> g.add_vertex(Recipe(['r2', [], '', '', '', ['a', 'c'], 0.0]), {'a': 1, 'c': 1})
+    >>> g.add_edge('r1')
+    >>> g.add_edge('r2')
+    >>> view = GraphView([g.get_item('r2')])
+    >>> view.filter_kind('')
+    [_Vertex(a, kind=ingredient), _Vertex(c, kind=ingredient), _Vertex(r2, kind=recipe)]
+    >>> view.check_exist('b')
+    False
+    >>> view.get_most_connected_ingredients()
+    [(1, 'c', 1.0), (1, 'a', 1.0)]
+    >>> view.get_item('a').neighbours, g.get_item('a').depth()
+    (frozenset({_Vertex(r2, kind=recipe)}), 2)
+    """
+    # Private Instance Attributes:
+    #     - _recipes:
+    #         The selected recipe vertices, in order.
+    #     - _members:
+    #         Maps the item of every vertex in this view to its vertex (a _ViewVertex for ingredients), in the
+    #         order add_vertex would have added them, or None until it is first needed.
+    #     - _degrees:
+    #         Maps each ingredient in this view to the number of selected recipes that use it, or None until it
+    #         is first needed.
+    _recipes: list[_Vertex]
+    _members: Optional[dict[str, _Vertex]]
+    _degrees: Optional[dict[str, int]]
+
+    def __init__(self, recipes: list[_Vertex]) -> None:
+        """Initialize a view of the given recipe vertices."""
+        self._recipes = recipes
+        self._members = None
+        self._degrees = None
+
+    def _get_members(self) -> dict[str, _Vertex]:
+        """Return the vertices of this view by item, in order, computing them first if needed."""
+        if self._members is None:
+            users = {}
+            for recipe in dict.fromkeys(self._recipes):
+                for ingredient in recipe.iter_neighbours():
+                    users.setdefault(ingredient, []).append(recipe)
+            shown = {ingredient.item: _ViewVertex(ingredient, frozenset(recipes))
+                     for ingredient, recipes in users.items()}
+            # the ingredients of a recipe come before it, in the order of its cleaned ingredients
+            self._members = {}
+            for recipe in self._recipes:
+                for ingredient in recipe.v_cleaned_ingredients:
+                    self._members.setdefault(ingredient, shown[ingredient])
+                self._members.setdefault(recipe.item, recipe)
+        return self._members
+
+    def _get_degrees(self) -> dict[str, int]:
+        """Return the number of selected recipes that use each ingredient, computing it first if needed."""
+        if self._degrees is None:
+            self._degrees = {}
+            for recipe in self._recipes:
+                for ingredient in recipe.iter_neighbours():
+                    self._degrees[ingredient.item] = self._degrees.get(ingredient.item, 0) + 1
+        return self._degrees
+
+    def is_empty(self) -> bool:
+        """Returns True if this view is empty"""
+        return not self._recipes
 
-        return scores[:5]
+    def check_exist(self, item: str) -> bool:
+        """Check if this item exists inside the view, return True if it does."""
+        return item in self._get_members()
 
+    def filter_kind(self, kind: str) -> list:
+        """Return a list of all vertices in the view that match the given kind.
 
-def load_graph(uncleaned: str, ingredients: str, pricefile: str) -> Graph:
+        Preconditions:
+            - kind in {'', 'recipe', 'ingredient'}
+        """
+        if kind == 'recipe':
+            return list(self._recipes)
+        return [vertex for vertex in self._get_members().values() if kind in ('', vertex.kind)]
+
+    def get_item(self, name: str) -> Any:
+        """Gets the vertex object based on the name of the vertex, or None if it is not in this view."""
+        return self._get_members().get(name)
+
+    def to_networkx(self, max_vertices: int = 5000) -> nx.Graph:
+        """Convert this view into a networkx Graph, in the same way as Graph.to_networkx.
+        """
+        import networkx as nx
+        graph_nx = nx.Graph()
+        for v in self._get_members().values():
+            graph_nx.add_node(v.item, kind=v.kind)
+
+            for u in v.neighbours:
+                if graph_nx.number_of_nodes() < max_vertices:
+                    graph_nx.add_node(u.item, kind=u.kind)
+
+                if u.item in graph_nx.nodes:
+                    graph_nx.add_edge(v.item, u.item)
+
+            if graph_nx.number_of_nodes() >= max_vertices:
+                break
+
+        return graph_nx
+
+    def get_most_connected_ingredients(self) -> list[tuple[int, str, float]]:
+        """gets the highest depth ingredients in this view. returns a list of tuples, with the score, the name and
+        price. returns at most 10 ingredients in a tuple."""
+        members = self._get_members()
+        return heapq.nlargest(10, ((depth, item, members[item].price) for item, depth in self._get_degrees().items()))
+
+    def get_similar(self, ingredient: str) -> list:
+        """Gets the ingredients most similar to ingredient within this view, scored like Graph.get_similar.
+        Returns a list of at most, 5 ingredients.
+        """
+        target = self.get_item(ingredient)
+        if target is None or target.kind != 'ingredient':
+            raise ValueError(ingredient + " is not an ingredient in this view.")
+
+        shared_counts = {}
+        for recipe in target.neighbours:
+            for other in recipe.iter_neighbours():
+                if other is not target.vertex:
+                    shared_counts[other.item] = shared_counts.get(other.item, 0) + 1
+        degrees = self._get_degrees()
+        names = sorted(degrees, reverse=True)
+        return _top_similar(ingredient, shared_counts, degrees, names)
+
+    def shared_neighbours(self, ingredient1: str, ingredient2: str) -> int:
+        """Return the number of recipes in this view that use both ingredient1 and ingredient2."""
+        vertex1, vertex2 = self.get_item(ingredient1), self.get_item(ingredient2)
+        if vertex1 is None or vertex2 is None:
+            return 0
+        return len(vertex1.neighbours & vertex2.neighbours)
+
+
+@proj2stats.timed('load_graph')
+def load_graph(uncleaned: str, ingredients: str, pricefile: str, snapshot: Optional[str] = None,
+               workers: int = 1, compact: bool = False, lazy: bool = False, skip_first_row: bool = True) -> Graph:
     """Load a graph from the given uncleaned recipe csv file and ingredient csv file.
 
     The recipe graph stores all the information from the datasets as follows:
     - Create one vertex for each recipe and one vertex for each unique ingredient in the datasets.
     - Edges represent ingredient usage in a recipe (i.e., an edge is added between a recipe and all
       the ingredients it contains)
+
+    If snapshot is the path of a snapshot file (see proj2snapshot), the graph is read from it when it was saved
+    from the current versions of the three csv files. Otherwise the graph is built from the csv files and then
+    saved to snapshot, so that the next load is fast.
+
+    If workers is more than 1, the recipe csv file is cleaned by that many processes (see cleancsv_parallel)
+    and the number of rows each of them parsed per second is printed.
+
+    If compact is True, the graph is returned in its compact storage mode (see Graph.compact).
+
+    If lazy is True, the recipes are lazy (see Recipe): their full ingredients, instructions and image name are
+    read from uncleaned when they are used, so the memory the graph takes does not grow with the recipe text.
+    uncleaned must then stay unchanged while the graph is in use.
+
+    The first recipe in uncleaned is left out unless skip_first_row is False (see iter_recipes).
+    """
+    graph = None
+    settings = {} if skip_first_row else {'skip_first_row': False}
+    if snapshot is not None:
+        from proj2snapshot import load_snapshot
+        graph = load_snapshot(snapshot, [uncleaned, ingredients, pricefile], lazy, settings)
+
+    if graph is None:
+        graph = build_graph(uncleaned, ingredients, pricefile, workers, lazy, skip_first_row)
+        if snapshot is not None:
+            from proj2snapshot import save_snapshot
+            save_snapshot(graph, snapshot, [uncleaned, ingredients, pricefile], settings)
+
+    if compact:
+        graph.compact()
+    return graph
+
+
+@proj2stats.timed('build_graph')
+def build_graph(uncleaned: str, ingredients: str, pricefile: str, workers: int = 1, lazy: bool = False,
+                skip_first_row: bool = True) -> Graph:
+    """Build a graph from the given csv files, as described in load_graph.
+
+    With one worker, the rows stream from the recipe file into the graph one at a time (through clean_rows and
+    iter_recipes), so no list of every cleaned row or Recipe is made next to the graph.
     """
     prices = pricestodict(pricefile)
-    cleaned_csv = cleancsv(uncleaned, ingredients, prices)
-    recipe_lst = to_recipe_class(cleaned_csv)
+    if workers > 1:
+        cleaned_rows, worker_stats = cleancsv_parallel(uncleaned, ingredients, prices, workers, lazy)
+        for pid, (parsed, seconds) in worker_stats.items():
+            print("Worker " + str(pid) + ": " + str(parsed) + " rows in " + str(round(seconds, 2)) + "s || "
+                  + str(round(parsed / seconds if seconds else 0.0)) + " rows/sec")
+    else:
+        cleaned_rows = clean_rows(uncleaned, ingredients, prices, lazy)
+    recipes = iter_recipes(cleaned_rows, RecipeText(uncleaned) if lazy else None, skip_first_row)
 
     graph = Graph()
 
-    for recipe in recipe_lst:
-        graph.add_vertex(recipe, prices)
-        graph.add_edge(recipe.title)
+    with proj2stats.Timer('build_graph.add_recipes'):  # with one worker, this includes cleaning the rows
+        for recipe in recipes:
+            graph.add_vertex(recipe, prices)
+            graph.add_edge(recipe.title)
+    if proj2stats.enabled():
+        proj2stats.count('build_graph.vertices_created', len(graph.filter_kind('')))
+        proj2stats.count('build_graph.edges_created', sum(vertex.depth() for vertex in graph.filter_kind('recipe')))
 
     return graph
 
 
-def get_user_ingredients() -> list:
+def get_user_ingredients(lexicon: Optional[IngredientLexicon] = None) -> list:
     """Prompt user to input ingredients they have and want to use. User input stops when 'stop' is inputted.
     Returns list.
+
+    Ingredients are checked against lexicon (usually Graph.lexicon), so plurals and capitals are accepted and
+    typos get suggestions. If lexicon is None, one is made from the ingredients file.
     """
     user_input = []
-    all_ingredients = get_food('ingredients copy.csv')
+    lexicon = _prompt_lexicon(lexicon)
     print("===================================")
     print("Enter the ingredients you have and would like to use. Type 'stop' when done:")
     stop = False
@@ -574,28 +2363,32 @@ def get_user_ingredients() -> list:
             else:
                 print("You have not entered any ingredients. Try again.")
         else:
-            if choice not in all_ingredients:
-                print("Invalid ingredient, try again")
+            ingredient = lexicon.lookup(choice)
+            if ingredient is None:
+                print_invalid_ingredient(lexicon, choice)
             else:
-                user_input.append(choice)
+                user_input.append(ingredient)
     return user_input
 
 
-def get_user_single_ingredient() -> list:
+def get_user_single_ingredient(lexicon: Optional[IngredientLexicon] = None) -> list:
     """Prompt user to input a single ingredient they have, want to use, or want to know more about. Returns
     that ingredient in a list.
+
+    The ingredient is checked against lexicon, as in get_user_ingredients.
     """
     user_input = []
-    all_ingredients = get_food('ingredients copy.csv')
+    lexicon = _prompt_lexicon(lexicon)
     print("===================================")
     print("Enter the ingredient you'd like to know more about:")
     stop = False
     while not stop:
         choice = input("\nYour ingredient: ").lower().strip()
-        if choice not in all_ingredients:
-            print("Invalid ingredient, try again")
+        ingredient = lexicon.lookup(choice)
+        if ingredient is None:
+            print_invalid_ingredient(lexicon, choice)
         else:
-            user_input.append(choice)
+            user_input.append(ingredient)
         if user_input:
             stop = True
         else:
@@ -603,6 +2396,99 @@ def get_user_single_ingredient() -> list:
     return user_input
 
 
+def get_excluded_ingredients(lexicon: Optional[IngredientLexicon] = None) -> list:
+    """Prompt user to input ingredients that recipes must not use (like allergies). User input stops when 'stop'
+    is inputted, and can be empty. Returns list.
+
+    The ingredients are checked against lexicon, as in get_user_ingredients.
+    """
+    return _get_optional_ingredients(lexicon, "Enter any ingredients you want to avoid.", "Ingredient to avoid: ")
+
+
+def get_pantry_ingredients(lexicon: Optional[IngredientLexicon] = None) -> list:
+    """Prompt user to input the ingredients they already have, which can be none. User input stops when 'stop' is
+    inputted. Returns list.
+
+    The ingredients are checked against lexicon, as in get_user_ingredients.
+    """
+    return _get_optional_ingredients(lexicon, "Enter any ingredients you already have.", "Your ingredient: ")
+
+
+def _get_optional_ingredients(lexicon: Optional[IngredientLexicon], message: str, prompt: str) -> list:
+    """Print message, then prompt user to input ingredients with prompt until they enter 'stop', and return the
+    ingredients they entered, which can be none.
+    """
+    user_input = []
+    lexicon = _prompt_lexicon(lexicon)
+    print("===================================")
+    print(message + " Type 'stop' when done:")
+    while True:
+        choice = input("\n" + prompt).lower().strip()
+        if choice == 'stop':
+            return user_input
+        ingredient = lexicon.lookup(choice)
+        if ingredient is None:
+            print_invalid_ingredient(lexicon, choice)
+        else:
+            user_input.append(ingredient)
+
+
+def get_ranking() -> str:
+    """Prompt the user to choose how the recipes they get are ordered, and return the rank for filter_recipes."""
+    print("===================================")
+    print("How would you like your recipes sorted?")
+    print("- 1) Uses the most of your ingredients")
+    print("- 2) Cheapest to buy the rest of the ingredients for")
+    print("- 3) You already have the largest share of its ingredients")
+    while True:
+        choice = input("\nSelect from the following (enter a number): ").strip()
+        if choice in ('1', '2', '3'):
+            return {'1': 'matches', '2': 'cost', '3': 'coverage'}[choice]
+        print("Invalid response.")
+
+
+def get_pantry_only() -> bool:
+    """Prompt the user to choose whether to only see recipes that use nothing but the ingredients they have."""
+    print("===================================")
+    print("Only show recipes you can make with just the ingredients you entered?")
+    while True:
+        choice = input("\nEnter 'yes' or 'no': ").lower().strip()
+        if choice in ('yes', 'y', 'no', 'n'):
+            return choice in ('yes', 'y')
+        print("Invalid response.")
+
+
+def _prompt_lexicon(lexicon: Optional[IngredientLexicon]) -> IngredientLexicon:
+    """Return lexicon, or one made from the ingredients file if it is None, after making the tab key complete
+    ingredient names at the prompt where the readline module is available.
+    """
+    if lexicon is None:
+        lexicon = IngredientLexicon(dict.fromkeys(get_food('ingredients copy.csv'), 0))
+    try:
+        import readline
+    except ImportError:  # not every platform has readline, and completion is only a convenience
+        return lexicon
+
+    def complete(text: str, state: int) -> Optional[str]:
+        """Return the completion of text numbered state, or None if there are no more."""
+        completions = lexicon.complete(text)
+        return completions[state] if state < len(completions) else None
+
+    readline.set_completer_delims('')  # complete the whole line, since names can have spaces
+    readline.set_completer(complete)
+    readline.parse_and_bind('tab: complete')
+    return lexicon
+
+
+def print_invalid_ingredient(lexicon: IngredientLexicon, choice: str) -> None:
+    """Tell the user that choice is not an ingredient, suggesting the closest ones in lexicon if there are any."""
+    suggestions = lexicon.suggest(choice)
+    if suggestions:
+        print("Invalid ingredient, did you mean: " + ", ".join(suggestions) + "?")
+    else:
+        print("Invalid ingredient, try again")
+
+
 def get_recipe_limit() -> int:
     """Prompt the user to enter the maximum number of recipes they would like to receive.
 
@@ -641,7 +2527,10 @@ def get_price_limit() -> Optional[float]:
 
         try:
             limit = float(limit_input)
-            if limit < 0:
+            if not math.isfinite(limit):
+                limit = -1
+                print("Invalid response. Please enter a valid number.")
+            elif limit < 0:
                 print("Number must be greater than 0")
         except ValueError:
             print("Invalid response. Please enter a valid number.")
@@ -673,11 +2562,29 @@ def get_review_limit() -> Optional[int]:
     return limit
 
 
-def get_recipe(main_graph: Graph) -> Recipe:
+def get_budget() -> float:
+    """Prompt the user to enter the most they want to spend on groceries."""
+    print("===================================")
+    print("What is the most you'd like to spend on ingredients?")
+    while True:
+        budget_input = input("\nEnter a number: ").strip()
+        try:
+            budget = float(budget_input)
+        except ValueError:
+            budget = math.nan
+        if not math.isfinite(budget):
+            print("Invalid response. Please enter a valid number.")
+        elif budget < 0:
+            print("Number must be greater than 0")
+        else:
+            return budget
+
+
+def get_recipe(main_graph: Graph | GraphView) -> Recipe:
     """Gets user input on what recipe they want. Shows the recipes in groups of 10
     for easier viewing. Returns a Recipe object."""
     recipes = main_graph.filter_kind('recipe')
-    reviews = reviews_to_dict()
+    reviews = get_review_store()
     commands = {'prev', 'next'}
     numrecipes = len(recipes)
     cutoff = 10
@@ -687,9 +2594,9 @@ def get_recipe(main_graph: Graph) -> Recipe:
         print("===================================")
         print("What recipe would like like the full details for?")
         for recipe in recipes[cutoff - 10: cutoff]:
-            if recipe.item in reviews:
+            if reviews.average(recipe.item) is not None:
                 print("- " + recipe.item + " || Est. Price: $" + str(recipe.price) + " || Rating: "
-                      + str(reviews[recipe.item]))
+                      + str(reviews.average(recipe.item)))
             else:
                 print("- " + recipe.item + " || Est. Price: $" + str(recipe.price) + " || No Reviews Yet")
 
@@ -718,8 +2625,6 @@ def rate_recipe(recipe: Recipe) -> None:
     print("Would you like to rate this recipe? Enter 'yes' or anything else to cancel:")
     user_choice = input("\nEnter response: ").lower()
 
-    csv_file = "reviews.csv"
-
     if user_choice == "yes":
         recipe_name = recipe.title
         while True:
@@ -735,25 +2640,35 @@ def rate_recipe(recipe: Recipe) -> None:
 
         print("===================================")
         review = input("Write your review: ")
-        new_entry = pd.DataFrame([[recipe_name, rating, review]], columns=["Recipe", "Rating", "Review"])
-
-        if os.path.exists(csv_file):
-            new_entry.to_csv(csv_file, mode='a', header=False, index=False)
-        else:
-            new_entry.to_csv(csv_file, mode='w', header=True, index=False)
+        save_review(recipe_name, rating, review)
 
         print("Your review has been saved!")
 
 
-def find_pairings(sub_graph: Graph, ingredient: str) -> None:
-    """Print popular pairings. Calls a graph function to find ingredients with similar neighbours."""
-    similar = sub_graph.get_similar(ingredient)
+def save_review(recipe_name: str, rating: int, review: str, csv_file: str = "reviews.csv") -> None:
+    """Append a review of the recipe called recipe_name to csv_file, creating the file if needed, and update the
+    shared ReviewStore for that file.
+    """
+    import pandas as pd
+    new_entry = pd.DataFrame([[recipe_name, rating, review]], columns=["Recipe", "Rating", "Review"])
+
+    if os.path.exists(csv_file):
+        new_entry.to_csv(csv_file, mode='a', header=False, index=False)
+    else:
+        new_entry.to_csv(csv_file, mode='w', header=True, index=False)
+
+    get_review_store(csv_file)  # reads the new row into the store
+
+
+def find_pairings(main_graph: Graph, ingredient: str) -> None:
+    """Print popular pairings. Calls a graph function to find the ingredients that appear most with ingredient."""
+    similar = main_graph.get_pairings(ingredient)
     print("===================================")
     print("The ingredients that appear the most with " + ingredient + " are:")
     for item in similar:
-        recipesshared = sub_graph.get_item(item[1]).shared_neighbours(sub_graph.get_item(ingredient))
+        recipesshared = item[2]
         print("- " + item[1] + " || Similarity score: " + str(item[0]) + " || Shares " + str(recipesshared) +
-              " recipes || " + "~$" + str(sub_graph.get_item(item[1]).price))
+              " recipes || " + "~$" + str(main_graph.get_item(item[1]).price))
 
     print("===================================")
     input("Press enter to continue...")
@@ -762,11 +2677,15 @@ def find_pairings(sub_graph: Graph, ingredient: str) -> None:
 def option_1(main_graph: Graph) -> None:
     """Does option 1, that being 'enter ingredients you already have'."""
     prices = pricestodict('ingredient_prices.csv')
-    user_ingredients = get_user_ingredients()
+    user_ingredients = get_user_ingredients(main_graph.lexicon())
+    pantry = get_pantry_only()
+    excluded = get_excluded_ingredients(main_graph.lexicon())
     user_limit = get_recipe_limit()
     price_limit = get_price_limit()
     review_limit = get_review_limit()
-    user_recipes = main_graph.filter_recipes(user_limit, user_ingredients, prices, price_limit, review_limit)
+    ranking = get_ranking()
+    user_recipes = main_graph.filter_recipes(user_limit, user_ingredients, prices, price_limit, review_limit,
+                                             excluded=excluded, pantry=pantry, rank=ranking)
 
     if user_recipes.is_empty():
         print("===================================")
@@ -780,6 +2699,10 @@ def option_1(main_graph: Graph) -> None:
         print("Ingredients:")
         for ingredient in choice.full_ingredients:
             print("- " + ingredient)
+        missing_cost, missing = main_graph.missing_ingredients(choice.title, user_ingredients)
+        if missing:
+            print()
+            print("You still need: " + ", ".join(missing) + " (~$" + str(missing_cost) + ")")
         print()
         print(choice.instructions)
         print()
@@ -789,11 +2712,9 @@ def option_1(main_graph: Graph) -> None:
 def option_2(main_graph: Graph) -> None:
     """Does option 2 in the main, which lets the user input an ingredient and then outputs the most connected
     ingredients associated"""
-    prices = pricestodict('ingredient_prices.csv')
     price_limit = get_price_limit()
     review_limit = get_review_limit()
-    user_recipes = main_graph.filter_recipes(14000, [], prices, price_limit, review_limit)
-    lst = user_recipes.get_most_connected_ingredients()
+    lst = main_graph.top_ingredients(10, price_limit, review_limit)
     print("===================================")
     print("Here are the the most common ingredients for recipes within your price range and rating range:")
     if not lst:
@@ -807,17 +2728,14 @@ def option_2(main_graph: Graph) -> None:
 
 def option_3(main_graph: Graph) -> None:
     """Does option 3 in the main, which finds popular ingredient pairings"""
-    prices = pricestodict('ingredient_prices.csv')
-    user_ingredients = get_user_single_ingredient()
-    recipe_limit = 14000
-    user_recipes = main_graph.filter_recipes(recipe_limit, user_ingredients, prices, None, None)
-    find_pairings(user_recipes, user_ingredients[0])
+    user_ingredients = get_user_single_ingredient(main_graph.lexicon())
+    find_pairings(main_graph, user_ingredients[0])
 
 
 def option_4(main_graph: Graph) -> None:
     """Does option 4 in the main, which asks for filters than provides a visualizaiton"""
     prices = pricestodict('ingredient_prices.csv')
-    user_ingredients = get_user_ingredients()
+    user_ingredients = get_user_ingredients(main_graph.lexicon())
     user_limit = get_recipe_limit()
     price_limit = get_price_limit()
     user_recipes = main_graph.filter_recipes(user_limit, user_ingredients, prices, price_limit, None)
@@ -827,11 +2745,44 @@ def option_4(main_graph: Graph) -> None:
         print("No recipes found with your filters. Please try again.")
     else:
         from proj2visualisation import visualize_graph
+        from proj2layout import view_positions
         print("Loading...")
-        visualize_graph(user_recipes, highlight_ingredients=user_ingredients)
+        visualize_graph(user_recipes, highlight_ingredients=user_ingredients,
+                        positions=view_positions(main_graph, user_recipes))
         print("Graph completed!")
 
+
+def option_5(main_graph: Graph) -> None:
+    """Does option 5 in the main, which plans a number of recipes within a grocery budget and gives the shopping
+    list for them"""
+    from proj2planner import plan_meals
+    have = get_pantry_ingredients(main_graph.lexicon())
+    count = get_recipe_limit()
+    budget = get_budget()
+    review_limit = get_review_limit()
+    print("Planning...")
+    plan = plan_meals(main_graph, count, budget, have, reviewlimit=review_limit)
+
+    print("===================================")
+    if not plan.recipes:
+        print("No recipes fit in your budget. Please try again.")
+        return
+    if len(plan.recipes) < count:
+        print("Only " + str(len(plan.recipes)) + " recipes fit in your budget.")
+    print("Recipes:")
+    for title in plan.recipes:
+        print("- " + title)
+    print()
+    print("Shopping list:")
+    if not plan.shopping_list:
+        print("- Nothing, you already have every ingredient!")
+    for ingredient, price in plan.shopping_list:
+        print("- " + ingredient + " || Price: ~$" + str(price))
+    print()
+    print("Total: ~$" + str(plan.cost))
+
 if __name__ == "__main__":
+    import doctest
     import python_ta
     python_ta.check_all(config={
         'max-line-length': 120,
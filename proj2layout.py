@@ -0,0 +1,215 @@
+"""Positions for drawing recipe graphs, worked out once and then reused, so visualize_graph does not have to lay
+out every graph it draws from scratch.
+
+There are three parts:
+    - global_layout: positions for every ingredient of the full graph, from a force-directed layout of the
+      ingredients linked to their most similar ingredients. It is computed once per graph and saved to disk.
+    - view_positions: positions for any part of the graph (like the GraphView that option 4 draws), read from
+      the global layout. Recipes sit in the middle of their ingredients. A few extra iterations of the layout
+      can tidy them up, starting from those positions.
+    - cached_layout: any networkx layout of any graph, saved to disk under a hash of the graph and the layout,
+      so the same drawing is only laid out once.
+
+Everything is saved as JSON in a cache directory (LAYOUT_CACHE by default).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import math
+import os
+import random
+import weakref
+from typing import Any, Optional
+
+from proj2functions import Graph, GraphView, _Vertex
+
+LAYOUT_CACHE = '.layout_cache'
+VERSION = 1
+RECIPE_SPREAD = 0.03
+
+_global_layouts = weakref.WeakKeyDictionary()
+
+
+def force_layout(nodes: list[str], edges: list[tuple[str, str, float]], iterations: int = 50, seed: int = 0,
+                 initial: Optional[dict[str, tuple[float, float]]] = None,
+                 temperature: float = 0.1) -> dict[str, tuple[float, float]]:
+    """Return a position between -1 and 1 on both axes for each of nodes, from a force-directed layout in which
+    each (node, node, weight) in edges pulls its ends together in proportion to its weight (from 0 to 1), and
+    every pair of nodes pushes apart.
+
+    This is the grid variant of the Fruchterman-Reingold layout: a node is only pushed by the nodes in the
+    grid cells around it, so an iteration takes time proportional to the number of nodes and edges rather than
+    to the number of pairs of nodes. Nodes start at their positions in initial if they have one (in the same
+    -1 to 1 range), or at random otherwise. The largest step a node can take starts at temperature and cools
+    to 0 over the iterations.
+
+    >>> positions = force_layout(['a', 'b', 'c'], [('a', 'b', 1.0)], iterations=30)
+    >>> sorted(positions)
+    ['a', 'b', 'c']
+    >>> all(-1 <= x <= 1 and -1 <= y <= 1 for x, y in positions.values())
+    True
+    """
+    n = len(nodes)
+    if n == 0:
+        return {}
+    rng = random.Random(seed)
+    index = {node: i for i, node in enumerate(nodes)}
+    xs, ys = [], []
+    for node in nodes:
+        if initial is not None and node in initial:
+            xs.append((initial[node][0] + 1) / 2)
+            ys.append((initial[node][1] + 1) / 2)
+        else:
+            xs.append(rng.random())
+            ys.append(rng.random())
+    links = [(index[a], index[b], weight) for a, b, weight in edges if a in index and b in index and a != b]
+
+    k = math.sqrt(1.0 / n)  # the ideal distance between nodes in a unit square
+    cell = 2 * k
+    for step in range(iterations):
+        dx, dy = [0.0] * n, [0.0] * n
+        grid = {}
+        for i in range(n):
+            grid.setdefault((int(xs[i] // cell), int(ys[i] // cell)), []).append(i)
+        for (cx, cy), members in grid.items():
+            near = [j for ox in (-1, 0, 1) for oy in (-1, 0, 1) for j in grid.get((cx + ox, cy + oy), ())]
+            for i in members:
+                for j in near:
+                    if j != i:
+                        ddx, ddy = xs[i] - xs[j], ys[i] - ys[j]
+                        distance2 = ddx * ddx + ddy * ddy
+                        if distance2 == 0:
+                            ddx, ddy, distance2 = rng.uniform(-k, k) / 100, rng.uniform(-k, k) / 100, k * k / 1e4
+                        if distance2 < cell * cell:
+                            force = k * k / distance2  # k^2 / distance, along the unit vector
+                            dx[i] += ddx * force
+                            dy[i] += ddy * force
+        for i, j, weight in links:
+            ddx, ddy = xs[i] - xs[j], ys[i] - ys[j]
+            force = math.sqrt(ddx * ddx + ddy * ddy) * weight / k  # distance^2 / k, along the unit vector
+            dx[i] -= ddx * force
+            dy[i] -= ddy * force
+            dx[j] += ddx * force
+            dy[j] += ddy * force
+
+        limit = temperature * (1 - step / iterations)
+        for i in range(n):
+            length = math.sqrt(dx[i] * dx[i] + dy[i] * dy[i])
+            if length > 0:
+                scale = min(length, limit) / length
+                xs[i] += dx[i] * scale
+                ys[i] += dy[i] * scale
+
+    centre_x, centre_y = sum(xs) / n, sum(ys) / n
+    extent = max(max(abs(x - centre_x) for x in xs), max(abs(y - centre_y) for y in ys)) or 1.0
+    return {node: ((xs[i] - centre_x) / extent, (ys[i] - centre_y) / extent) for i, node in enumerate(nodes)}
+
+
+def _ingredient_skeleton(graph: Graph) -> tuple[list[str], list[tuple[str, str, float]]]:
+    """Return the ingredients of graph in order of name, and the edges between each ingredient and the
+    ingredients most similar to it (see Graph.get_similar), weighted by their similarity score.
+    """
+    nodes = sorted(vertex.item for vertex in graph.filter_kind('ingredient'))
+    edges = {}
+    for ingredient in nodes:
+        for score, other in graph.get_similar(ingredient):
+            if score > 0:
+                edges[min(ingredient, other), max(ingredient, other)] = score
+    return nodes, sorted((a, b, score) for (a, b), score in edges.items())
+
+
+def _content_key(*content: Any) -> str:
+    """Return a hash of content, which must be JSON serializable."""
+    return hashlib.blake2b(json.dumps([VERSION, *content]).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _read_cache(cache_dir: str, name: str) -> Optional[dict[str, tuple[float, float]]]:
+    """Return the positions saved in the cache file with the given name, or None if there is none."""
+    try:
+        with open(os.path.join(cache_dir, name + '.json'), 'r', encoding="utf-8") as file:
+            return {node: (x, y) for node, (x, y) in json.load(file).items()}
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _write_cache(cache_dir: str, name: str, positions: dict[str, tuple[float, float]]) -> None:
+    """Save positions to the cache file with the given name, writing it next to its place first."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, name + '.json')
+    with open(path + '.tmp', 'w', encoding="utf-8") as file:
+        json.dump({node: [x, y] for node, (x, y) in positions.items()}, file)
+    os.replace(path + '.tmp', path)
+
+
+def global_layout(graph: Graph, cache_dir: str = LAYOUT_CACHE) -> dict[str, tuple[float, float]]:
+    """Return the position of every ingredient of graph in its global layout.
+
+    The layout is saved in cache_dir under a hash of the ingredients and their similarity edges, so it is only
+    computed the first time it is needed for a graph with this content. It is also kept in memory for as long
+    as graph is alive and its numbers of vertices and edges stay the same.
+    """
+    stamp = (len(graph.filter_kind('')), sum(vertex.depth() for vertex in graph.filter_kind('ingredient')))
+    if graph in _global_layouts and _global_layouts[graph][0] == stamp:
+        return _global_layouts[graph][1]
+
+    nodes, edges = _ingredient_skeleton(graph)
+    name = 'global-' + _content_key(nodes, edges)
+    positions = _read_cache(cache_dir, name)
+    if positions is None:
+        positions = force_layout(nodes, edges, iterations=60)
+        _write_cache(cache_dir, name, positions)
+    _global_layouts[graph] = (stamp, positions)
+    return positions
+
+
+def recipe_position(recipe: _Vertex, ingredient_positions: dict[str, tuple[float, float]]) -> tuple[float, float]:
+    """Return the position of recipe: the middle of its ingredients, moved a little in a direction that depends
+    only on its title, so recipes with the same ingredients do not cover each other.
+    """
+    points = [ingredient_positions[u.item] for u in recipe.neighbours if u.item in ingredient_positions]
+    x = sum(point[0] for point in points) / len(points) if points else 0.0
+    y = sum(point[1] for point in points) / len(points) if points else 0.0
+    angle = int.from_bytes(hashlib.blake2b(recipe.item.encode('utf-8'), digest_size=4).digest(), 'little')
+    angle = angle / 2 ** 32 * 2 * math.pi
+    return x + RECIPE_SPREAD * math.cos(angle), y + RECIPE_SPREAD * math.sin(angle)
+
+
+def view_positions(graph: Graph, view: Graph | GraphView, refine: int = 0,
+                   cache_dir: str = LAYOUT_CACHE) -> dict[str, tuple[float, float]]:
+    """Return the position of every vertex of view, which is graph or part of it (such as the GraphView that
+    filter_recipes returns), taken from the global layout of graph.
+
+    If refine is more than 0, that many iterations of force_layout are run on view, starting from those
+    positions, with a low temperature so the vertices only settle a little.
+    """
+    ingredient_positions = global_layout(graph, cache_dir)
+    positions = {}
+    for vertex in view.filter_kind('ingredient'):
+        positions[vertex.item] = ingredient_positions.get(vertex.item, (0.0, 0.0))
+    recipes = view.filter_kind('recipe')
+    for recipe in recipes:
+        positions[recipe.item] = recipe_position(recipe, ingredient_positions)
+
+    if refine > 0:
+        edges = [(recipe.item, ingredient.item, 1.0) for recipe in recipes for ingredient in recipe.neighbours]
+        positions = force_layout(list(positions), edges, iterations=refine, initial=positions, temperature=0.02)
+    return positions
+
+
+def cached_layout(graph_nx: Any, layout: str = 'spring_layout',
+                  cache_dir: str = LAYOUT_CACHE) -> dict[str, tuple[float, float]]:
+    """Return the positions that the networkx function with the given name (like 'spring_layout') gives the
+    nodes of graph_nx, a networkx Graph.
+
+    The positions are saved in cache_dir under a hash of the layout name and the nodes and edges of graph_nx,
+    so drawing the same graph again does not lay it out again.
+    """
+    name = layout + '-' + _content_key(layout, sorted(map(str, graph_nx.nodes)),
+                                       sorted(sorted(map(str, edge)) for edge in graph_nx.edges))
+    positions = _read_cache(cache_dir, name)
+    if positions is None or set(positions) != set(map(str, graph_nx.nodes)):
+        import networkx as nx
+        positions = {str(node): (float(point[0]), float(point[1]))
+                     for node, point in getattr(nx, layout)(graph_nx).items()}
+        _write_cache(cache_dir, name, positions)
+    return positions
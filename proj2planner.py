@@ -0,0 +1,204 @@
+"""Meal plans: a number of recipes to cook within a budget, picked so they share ingredients and nothing on the
+shopping list is bought twice.
+
+    plan = plan_meals(graph, 5, 40.0)                 five recipes whose ingredients cost at most $40 in total
+    plan = plan_meals(graph, 5, 40.0, have=['egg'])   the same, not counting what is already in the pantry
+
+A plan costs the total price of the different ingredients its recipes use, less the ones already owned. Each
+recipe is worth 1, plus or minus up to rating_weight for an average rating above or below 3 (unrated recipes
+are worth 1), and the planner looks for the plan with the lowest cost per unit of worth: the cheapest plan, unless
+paying a little more buys much better rated recipes.
+
+The plan is picked greedily, one recipe at a time: next is the recipe with the lowest marginal cost (the price of
+the ingredients it needs that are not bought yet) per unit of worth. Buying an ingredient only lowers the
+marginal cost of the recipes that use it, so only those are updated, and the priority queue holds the recipes
+under version numbers, so out of date entries are skipped instead of searched for. A local search then swaps
+recipes in the plan for ones outside it while that lowers the cost per worth.
+"""
+from __future__ import annotations
+import heapq
+import time
+from typing import Iterable, Optional
+
+import proj2stats
+from proj2functions import Graph, get_review_store
+
+POOL_SIZE = 200
+
+
+class MealPlan:
+    """The recipes picked by plan_meals and what to buy for them.
+
+    Instance Attributes:
+        - recipes: the titles of the recipes, in the order they were picked
+        - shopping_list: every ingredient to buy for the recipes, once each, with its price, in order of name
+        - cost: the total price of shopping_list, rounded to cents
+    """
+    recipes: list[str]
+    shopping_list: list[tuple[str, float]]
+    cost: float
+
+    def __init__(self, recipes: list[str], shopping_list: list[tuple[str, float]]) -> None:
+        """Initialize a plan of the given recipes and shopping list."""
+        self.recipes = recipes
+        self.shopping_list = shopping_list
+        self.cost = round(sum((price for _, price in shopping_list), 0.0), 2)
+
+
+def recipe_worth(average: Optional[float], rating_weight: float) -> float:
+    """Return the worth of a recipe with the given average rating (None if it has none), as plan_meals counts it.
+
+    >>> [recipe_worth(average, 0.5) for average in [None, 1, 3, 5]]
+    [1.0, 0.5, 1.0, 1.5]
+    """
+    if average is None:
+        return 1.0
+    return 1.0 + rating_weight * (min(max(average, 1), 5) - 3) / 2
+
+
+@proj2stats.timed('plan_meals')
+def plan_meals(graph: Graph, count: int, budget: float, have: Iterable[str] = (),
+               pricelimit: Optional[float] = None, reviewlimit: Optional[float] = None, rating_weight: float = 0.5,
+               time_budget: float = 2.0, local_search: bool = True) -> MealPlan:
+    """Return a plan of count recipes from graph whose shopping list costs at most budget, with the lowest cost per
+    unit of worth that the planner finds (see the top of this file). Ingredients in have are already owned, so they
+    cost nothing and are not on the shopping list.
+
+    Only recipes that cost at most pricelimit on their own and have an average rating of at least reviewlimit
+    are picked, if those are not None. The plan has fewer than count recipes if no more fit in the budget. The
+    greedy pass always finishes, and the local search after it stops when it cannot improve the plan or when
+    time_budget seconds have passed since plan_meals was called. It is skipped if local_search is False.
+
+    Preconditions:
+        - count > 0
+        - 0 <= rating_weight < 1
+
+    >>> from proj2functions import load_graph
+    >>> my_graph = load_graph('food_small copy.csv', 'ingredients copy.csv', 'ingredient_prices.csv')
+    >>> plan = plan_meals(my_graph, 2, 60.0)
+    >>> plan.recipes, plan.cost
+    (['Apples and Oranges', "Newton's Law"], 37.32)
+    >>> [ingredient for ingredient, _ in plan.shopping_list]
+    ['apple', 'butter', 'cider', 'cinnamon', 'lemon', 'lemon juice', 'orange', 'sugar', 'water']
+    """
+    deadline = time.perf_counter() + time_budget
+    owned = set(have)
+    reviews = get_review_store()
+
+    # number the candidate recipes and the ingredients they still need, and list the candidates that use each one
+    titles, worth, needs, marginal = [], [], [], []
+    names, prices, users, ingredient_ids = [], [], [], {}
+    for recipe in graph.filter_kind('recipe'):
+        average = reviews.average(recipe.item)
+        if pricelimit is not None and recipe.price > pricelimit \
+                or reviewlimit is not None and (average is None or average < reviewlimit):
+            continue
+        need = [ingredient for ingredient in recipe.iter_neighbours() if ingredient.item not in owned]
+        own_cost = sum(ingredient.price for ingredient in need)
+        if own_cost > budget:  # buying other recipes' ingredients only helps with the ones they share
+            continue
+        recipe_id = len(titles)
+        for ingredient in need:
+            if ingredient.item not in ingredient_ids:
+                ingredient_ids[ingredient.item] = len(names)
+                names.append(ingredient.item)
+                prices.append(ingredient.price)
+                users.append([])
+            users[ingredient_ids[ingredient.item]].append(recipe_id)
+        titles.append(recipe.item)
+        worth.append(recipe_worth(average, rating_weight))
+        needs.append([ingredient_ids[ingredient.item] for ingredient in need])
+        marginal.append(own_cost)
+
+    plan = _greedy(count, budget, worth, needs, marginal, prices, users)
+    if local_search and plan:
+        _swap_search(plan, budget, deadline, worth, needs, marginal, prices)
+
+    bought = {i for recipe_id in plan for i in needs[recipe_id]}
+    return MealPlan([titles[recipe_id] for recipe_id in plan], sorted((names[i], prices[i]) for i in bought))
+
+
+def _greedy(count: int, budget: float, worth: list[float], needs: list[list[int]], marginal: list[float],
+            prices: list[float], users: list[list[int]]) -> list[int]:
+    """Return the ids of up to count recipes picked one at a time, each the affordable recipe with the lowest
+    marginal cost per worth, until count are picked or none fit in the budget.
+
+    marginal[recipe_id] starts as the price of everything recipe_id needs (needs[recipe_id], a list of ingredient
+    ids) and is lowered as ingredients are bought, ending as the marginal cost against the returned plan. users
+    lists the ids of the recipes that need each ingredient.
+    """
+    version = [0] * len(worth)
+    heap = [(marginal[recipe_id] / worth[recipe_id], recipe_id, 0) for recipe_id in range(len(worth))]
+    heapq.heapify(heap)
+    bought = [False] * len(prices)
+    picked = [False] * len(worth)
+    plan = []
+    spent = 0.0
+    while heap and len(plan) < count:
+        _, recipe_id, recipe_version = heapq.heappop(heap)
+        if picked[recipe_id] or recipe_version != version[recipe_id]:
+            continue  # out of date: a newer entry for this recipe is in the heap
+        if spent + marginal[recipe_id] > budget + 1e-9:
+            continue  # it comes back with a new entry if buying a shared ingredient makes it cheaper
+        plan.append(recipe_id)
+        picked[recipe_id] = True
+        spent += marginal[recipe_id]
+        for i in needs[recipe_id]:
+            if not bought[i]:
+                bought[i] = True
+                for other in users[i]:
+                    if not picked[other]:
+                        marginal[other] -= prices[i]
+                        version[other] += 1
+                        heapq.heappush(heap, (max(marginal[other], 0.0) / worth[other], other, version[other]))
+    return plan
+
+
+def _swap_search(plan: list[int], budget: float, deadline: float, worth: list[float], needs: list[list[int]],
+                 marginal: list[float], prices: list[float]) -> None:
+    """Improve plan in place by swapping one of its recipes for one outside it, as long as a swap lowers the cost
+    per worth of the plan within the budget and the deadline has not passed.
+
+    The recipes tried are the POOL_SIZE outside the plan with the lowest marginal cost per worth against the plan
+    that the greedy pass picked (marginal, as _greedy leaves it).
+    """
+    in_plan = set(plan)
+    pool = heapq.nsmallest(POOL_SIZE, (recipe_id for recipe_id in range(len(worth)) if recipe_id not in in_plan),
+                           key=lambda recipe_id: marginal[recipe_id] / worth[recipe_id])
+    uses = {}
+    for recipe_id in plan:
+        for i in needs[recipe_id]:
+            uses[i] = uses.get(i, 0) + 1
+    cost = sum(prices[i] for i in uses)
+    total_worth = sum(worth[recipe_id] for recipe_id in plan)
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for position, out in enumerate(plan):
+            only_out = {i for i in needs[out] if uses[i] == 1}
+            without = cost - sum(prices[i] for i in only_out)
+            for candidate in pool:
+                if candidate in in_plan:
+                    continue
+                new_cost = without + sum(prices[i] for i in needs[candidate] if i not in uses or i in only_out)
+                new_worth = total_worth - worth[out] + worth[candidate]
+                if new_cost <= budget + 1e-9 and new_cost * total_worth < cost * new_worth - 1e-9:
+                    for i in needs[out]:
+                        uses[i] -= 1
+                        if uses[i] == 0:
+                            del uses[i]
+                    for i in needs[candidate]:
+                        uses[i] = uses.get(i, 0) + 1
+                    in_plan.remove(out)
+                    in_plan.add(candidate)
+                    plan[position] = candidate
+                    cost, total_worth, improved = new_cost, new_worth, True
+                    break
+            if improved:
+                break
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,260 @@
+"""Non-interactive queries against a loaded recipe graph, and a batch mode that runs them from JSON lines.
+
+Each query is a JSON object with a "type" and the same choices main.py asks for interactively:
+    {"type": "search", "ingredients": ["egg", "potato"], "limit": 10, "price": 20.0, "rating": 4}
+    {"type": "search", "ingredients": ["egg", "potato", "salt"], "pantry": true, "exclude": ["butter"]}
+    {"type": "search", "ingredients": ["egg", "potato"], "rank": "cost"}
+    {"type": "top_ingredients", "price": 20.0, "rating": null}
+    {"type": "pairings", "ingredient": "egg"}
+    {"type": "recipe", "title": "Crispy Salt and Pepper Potatoes"}
+    {"type": "autocomplete", "prefix": "pot", "limit": 5}
+    {"type": "lookup", "ingredient": "potatos"}
+    {"type": "meal_plan", "count": 5, "budget": 40.0, "have": ["egg"], "rating": 3, "time_budget": 1.0}
+"price", "rating" and "limit" are optional, and so are the search fields "include" (ingredients every recipe must
+use), "exclude" (ingredients no recipe may use), "pantry" (true for only the recipes that use nothing but
+"ingredients") and "rank" ("matches", "cost" or "coverage", see Graph.filter_recipes). Searches ranked by cost or
+coverage also give what each recipe still needs and its price. In a meal plan (see proj2planner), "have", "price",
+"rating" and "time_budget" are optional. An "id" in a query is copied to its result.
+Ingredient names are matched like the menu matches them (see IngredientLexicon), so "Eggs" is the same as "egg".
+"""
+from __future__ import annotations
+import json
+import math
+import sys
+import time
+from typing import Any, Iterable, TextIO
+
+import proj2stats
+from proj2functions import Graph, get_review_store
+from proj2planner import plan_meals
+
+
+class QueryError(Exception):
+    """An exception raised when a query is malformed or refers to something that is not in the graph."""
+
+
+def run_query(graph: Graph, query: dict[str, Any]) -> dict[str, Any]:
+    """Return the result of one query against graph, as a JSON-compatible dictionary.
+
+    Raise QueryError if the query is malformed.
+
+    >>> from proj2functions import load_graph
+    >>> my_graph = load_graph('food_small copy.csv', 'ingredients copy.csv', 'ingredient_prices.csv')
+    >>> result = run_query(my_graph, {'type': 'search', 'ingredients': ['potato', 'rosemary'], 'limit': 1})
+    >>> [recipe['title'] for recipe in result['recipes']]
+    ['Crispy Salt and Pepper Potatoes']
+    """
+    kind = query.get('type')
+    if kind == 'search':
+        return _search(graph, query)
+    elif kind == 'top_ingredients':
+        return _top_ingredients(graph, query)
+    elif kind == 'pairings':
+        return _pairings(graph, query)
+    elif kind == 'recipe':
+        return _recipe(graph, query)
+    elif kind == 'autocomplete':
+        return _autocomplete(graph, query)
+    elif kind == 'lookup':
+        return _lookup(graph, query)
+    elif kind == 'meal_plan':
+        return _meal_plan(graph, query)
+    raise QueryError("Unknown query type: " + repr(kind))
+
+
+def _limits(query: dict[str, Any]) -> tuple[Any, Any]:
+    """Return the price and rating limits of query, checking that they are finite numbers or missing.
+
+    >>> _limits({'price': 20, 'rating': float('nan')})
+    Traceback (most recent call last):
+    ...
+    proj2queries.QueryError: "rating" must be a finite number or null
+    """
+    price, rating = query.get('price'), query.get('rating')
+    for name, value in (('price', price), ('rating', rating)):
+        if value is not None and not _is_number(value):
+            raise QueryError('"' + name + '" must be a finite number or null')
+    return price, rating
+
+
+def _is_number(value: Any) -> bool:
+    """Return whether value is a finite int or float (JSON allows NaN and Infinity, which are not limits)."""
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value)
+
+
+def _ingredient(graph: Graph, name: Any) -> str:
+    """Return the ingredient in graph that name means, and raise QueryError (with suggestions) if there is none."""
+    if not isinstance(name, str):
+        raise QueryError("Unknown ingredient: " + repr(name))
+    lexicon = graph.lexicon()
+    ingredient = lexicon.lookup(name)
+    if ingredient is None:
+        suggestions = lexicon.suggest(name)
+        raise QueryError("Unknown ingredient: " + repr(name)
+                         + (" (did you mean " + ", ".join(map(repr, suggestions)) + "?)" if suggestions else ""))
+    return ingredient
+
+
+def _search(graph: Graph, query: dict[str, Any]) -> dict[str, Any]:
+    """Return the best recipes for the ingredients in query, like option 1."""
+    lists = {}
+    for name in ('ingredients', 'include', 'exclude'):
+        items = query.get(name, [])
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            raise QueryError('"' + name + '" must be a list of strings')
+        lists[name] = items
+    limit, pantry, rank = query.get('limit', 10), query.get('pantry', False), query.get('rank', 'matches')
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise QueryError('"limit" must be a positive integer')
+    if not isinstance(pantry, bool):
+        raise QueryError('"pantry" must be true or false')
+    if rank not in ('matches', 'cost', 'coverage'):
+        raise QueryError('"rank" must be "matches", "cost" or "coverage"')
+    price, rating = _limits(query)
+    lexicon = graph.lexicon()
+    for name, items in lists.items():
+        lists[name] = [lexicon.lookup(item) or item for item in items]  # unknown ones just match nothing
+
+    reviews = get_review_store()
+    recipes = graph.filter_recipes(limit, lists['ingredients'], {}, price, rating, lists['include'], lists['exclude'],
+                                   pantry, rank).filter_kind('recipe')
+    results = [{'title': recipe.item, 'price': recipe.price, 'rating': reviews.average(recipe.item)}
+               for recipe in recipes]
+    if rank != 'matches':
+        for result in results:
+            result['missing_cost'], result['missing'] = graph.missing_ingredients(result['title'],
+                                                                                 lists['ingredients'])
+    return {'recipes': results}
+
+
+def _top_ingredients(graph: Graph, query: dict[str, Any]) -> dict[str, Any]:
+    """Return the most common ingredients among recipes within the price and rating limits, like option 2."""
+    price, rating = _limits(query)
+    top = graph.top_ingredients(10, price, rating)
+    return {'ingredients': [{'ingredient': item, 'recipes': depth, 'price': item_price}
+                            for depth, item, item_price in top]}
+
+
+def _pairings(graph: Graph, query: dict[str, Any]) -> dict[str, Any]:
+    """Return the ingredients that appear most with the ingredient in query, like option 3."""
+    ingredient = _ingredient(graph, query.get('ingredient'))
+    return {'pairings': [{'ingredient': item, 'similarity': score, 'shared_recipes': shared,
+                          'price': graph.get_item(item).price}
+                         for score, item, shared in graph.get_pairings(ingredient)]}
+
+
+def _recipe(graph: Graph, query: dict[str, Any]) -> dict[str, Any]:
+    """Return the full details of the recipe titled in query."""
+    title = query.get('title')
+    vertex = graph.get_item(title) if isinstance(title, str) else None
+    if vertex is None or vertex.kind != 'recipe':
+        raise QueryError("Unknown recipe: " + repr(title))
+    recipe = vertex.details
+    return {'title': recipe.title, 'price': recipe.price, 'rating': get_review_store().average(recipe.title),
+            'ingredients': recipe.cleaned_ingredients, 'full_ingredients': recipe.full_ingredients,
+            'instructions': recipe.instructions, 'image_name': recipe.image_name}
+
+
+def _autocomplete(graph: Graph, query: dict[str, Any]) -> dict[str, Any]:
+    """Return the most used ingredients whose names start with the prefix in query."""
+    prefix, limit = query.get('prefix'), query.get('limit', 10)
+    if not isinstance(prefix, str):
+        raise QueryError('"prefix" must be a string')
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise QueryError('"limit" must be a positive integer')
+    return {'ingredients': graph.lexicon().complete(prefix, limit)}
+
+
+def _lookup(graph: Graph, query: dict[str, Any]) -> dict[str, Any]:
+    """Return the ingredient that the name in query means (or None), and the closest ingredients to it if there is
+    none.
+    """
+    name = query.get('ingredient')
+    if not isinstance(name, str):
+        raise QueryError('"ingredient" must be a string')
+    lexicon = graph.lexicon()
+    ingredient = lexicon.lookup(name)
+    return {'ingredient': ingredient, 'suggestions': [] if ingredient is not None else lexicon.suggest(name)}
+
+
+def _meal_plan(graph: Graph, query: dict[str, Any]) -> dict[str, Any]:
+    """Return the recipes and shopping list of a plan of the number of recipes in query within its budget."""
+    count, budget, have = query.get('count'), query.get('budget'), query.get('have', [])
+    time_budget = query.get('time_budget', 2.0)
+    if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+        raise QueryError('"count" must be a positive integer')
+    for name, value in (('budget', budget), ('time_budget', time_budget)):
+        if not _is_number(value) or value < 0:
+            raise QueryError('"' + name + '" must be a finite number that is not negative')
+    if not isinstance(have, list) or not all(isinstance(item, str) for item in have):
+        raise QueryError('"have" must be a list of strings')
+    price, rating = _limits(query)
+    lexicon = graph.lexicon()
+    have = [lexicon.lookup(item) or item for item in have]
+
+    plan = plan_meals(graph, count, budget, have, price, rating, time_budget=time_budget)
+    return {'recipes': plan.recipes, 'cost': plan.cost,
+            'shopping_list': [{'ingredient': item, 'price': item_price} for item, item_price in plan.shopping_list]}
+
+
+def run_batch(graph: Graph, lines: Iterable[str], out: TextIO) -> dict[str, float]:
+    """Run every query in lines (one JSON object per line; blank lines are skipped) against graph, writing one
+    JSON result line to out per query as soon as it is done, and return a summary of the run.
+
+    Every result has the query's "id" (if it had one), its "latency_ms", and either its "result" or an "error".
+    If stats are being recorded (see proj2stats), it also has the "stats" recorded while the query ran.
+    The summary has the number of queries and of errors, the total seconds, the throughput in queries per second,
+    and the mean, median and 95th percentile latency in milliseconds.
+    """
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for line in lines:
+        if not line.strip():
+            continue
+        query_started = time.perf_counter()
+        before = proj2stats.snapshot() if proj2stats.enabled() else None
+        output = {}
+        try:
+            query = json.loads(line)
+            if not isinstance(query, dict):
+                raise QueryError("A query must be a JSON object")
+            if 'id' in query:
+                output['id'] = query['id']
+            output['result'] = run_query(graph, query)
+        except (QueryError, json.JSONDecodeError) as error:
+            output['error'] = str(error)
+            errors += 1
+        latency = (time.perf_counter() - query_started) * 1000
+        latencies.append(latency)
+        output['latency_ms'] = round(latency, 3)
+        if before is not None:
+            output['stats'] = proj2stats.difference(before, proj2stats.snapshot())
+        out.write(json.dumps(output) + '\n')
+        out.flush()
+
+    seconds = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'queries': len(latencies),
+        'errors': errors,
+        'seconds': round(seconds, 6),
+        'queries_per_second': round(len(latencies) / seconds, 3) if seconds else 0.0,
+        'mean_latency_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        'p50_latency_ms': round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+        'p95_latency_ms': round(latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)], 3)
+        if latencies else 0.0,
+    }
+
+
+def run_batch_file(graph: Graph, path: str) -> int:
+    """Run the queries in the JSON-lines file at path ('-' for standard input) with run_batch, writing results to
+    standard output and the summary to standard error. Return 1 if any query failed, otherwise 0.
+    """
+    if path == '-':
+        summary = run_batch(graph, sys.stdin, sys.stdout)
+    else:
+        with open(path, 'r', encoding="utf-8") as file:
+            summary = run_batch(graph, file, sys.stdout)
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary['errors'] else 0
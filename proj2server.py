@@ -0,0 +1,270 @@
+"""An HTTP server that answers recipe graph queries as JSON, so the graph is loaded once instead of on every request.
+
+    python proj2server.py --port 8080
+
+Endpoints (GET parameters are the query fields described in proj2queries; lists are comma separated):
+    GET  /search?ingredients=egg,potato&limit=10&price=20&rating=4
+    GET  /search?ingredients=egg,potato,salt&pantry=true&exclude=butter
+    GET  /search?ingredients=egg,potato&rank=cost
+    GET  /top_ingredients?price=20&rating=4
+    GET  /pairings?ingredient=egg
+    GET  /recipe?title=Crispy+Salt+and+Pepper+Potatoes
+    GET  /autocomplete?prefix=pot&limit=5
+    GET  /lookup?ingredient=potatos
+    GET  /meal_plan?count=5&budget=40&have=egg,rice
+    POST /query     with any proj2queries query as the JSON body
+    POST /review    with {"title": ..., "rating": 1 to 5, "review": ...} as the JSON body
+
+Every response is a JSON object; errors are {"error": ...} with a 4xx status. Connections are kept alive.
+Queries are answered on the event loop, since they are short and only read the graph (a meal plan's search stops
+after its time_budget, two seconds by default). Reviews are saved by save_review (the same code rate_recipe uses)
+in a worker thread, one at a time, so the loop keeps serving reads.
+When the ingredient price file changes, the new prices are applied to the graph (see Graph.update_prices) before
+the next request is answered, without loading the graph again.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import math
+import os
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import proj2stats
+from proj2functions import Graph, load_graph, pricestodict, save_review
+from proj2queries import QueryError, run_query
+
+MAX_BODY = 1 << 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class HttpError(Exception):
+    """An exception raised when a request cannot be answered, with the HTTP status to answer it with.
+
+    Instance Attributes:
+        - status: the HTTP status code of the response
+    """
+    status: int
+
+    def __init__(self, status: int, message: str) -> None:
+        """Initialize an error with the given status and message."""
+        super().__init__(message)
+        self.status = status
+
+
+class QueryServer:
+    """Serves queries against one graph that stays in memory for as long as the server runs.
+
+    Instance Attributes:
+        - graph: the graph that queries are answered from
+        - pricefile: the ingredient price csv file whose changes are applied to graph, or None
+    """
+    graph: Graph
+    pricefile: Optional[str]
+    # Private Instance Attributes:
+    #     - _write_lock:
+    #         Held while a review is saved, so reviews are appended to the file one at a time.
+    #     - _prices_changed:
+    #         The modification time (in nanoseconds) of pricefile when its prices were last applied, or None.
+    _write_lock: asyncio.Lock
+    _prices_changed: Optional[int]
+
+    def __init__(self, graph: Graph, pricefile: Optional[str] = None) -> None:
+        """Initialize a server for graph, whose prices came from pricefile (if it is given)."""
+        self.graph = graph
+        self.pricefile = pricefile
+        self._write_lock = asyncio.Lock()
+        self._prices_changed = self._price_file_time()
+
+    def _price_file_time(self) -> Optional[int]:
+        """Return the modification time of the price file in nanoseconds, or None if there is none."""
+        try:
+            return os.stat(self.pricefile).st_mtime_ns if self.pricefile is not None else None
+        except OSError:
+            return None
+
+    def refresh_prices(self) -> None:
+        """Apply the prices in the price file to the graph if the file has changed since they were last applied."""
+        changed = self._price_file_time()
+        if changed is not None and changed != self._prices_changed:
+            self.graph.update_prices(pricestodict(self.pricefile))
+            self._prices_changed = changed
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer every request sent on one connection, until the client closes it or asks to."""
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, keep_alive, body = request
+                self.refresh_prices()
+                try:
+                    status, response = 200, await self.respond(method, target, body)
+                except HttpError as error:
+                    status, response = error.status, {'error': str(error)}
+                except QueryError as error:
+                    status, response = 400, {'error': str(error)}
+                writer.write(_encode_response(status, response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HttpError as error:  # the request itself could not be read, so the connection is not reused
+            writer.write(_encode_response(error.status, {'error': str(error)}, False))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method: str, target: str, body: bytes) -> dict[str, Any]:
+        """Return the JSON response to one request.
+
+        Raise HttpError or QueryError if the request cannot be answered.
+        """
+        url = urlsplit(target)
+        path = url.path.rstrip('/')
+        if path == '/query' or path == '/review':
+            if method != 'POST':
+                raise HttpError(405, path + " only accepts POST")
+            try:
+                payload = json.loads(body)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                raise HttpError(400, "The request body must be JSON")
+            if not isinstance(payload, dict):
+                raise HttpError(400, "The request body must be a JSON object")
+            if path == '/query':
+                return run_query(self.graph, payload)
+            return await self.save(payload)
+
+        if path not in ('/search', '/top_ingredients', '/pairings', '/recipe', '/autocomplete', '/lookup',
+                        '/meal_plan'):
+            raise HttpError(404, "Unknown endpoint: " + url.path)
+        if method != 'GET':
+            raise HttpError(405, path + " only accepts GET")
+        return run_query(self.graph, _query_from_parameters(path[1:], parse_qs(url.query)))
+
+    async def save(self, payload: dict[str, Any]) -> dict[str, Any]:
+        """Save the review in payload for a recipe in the graph, like rate_recipe, and return the saved review."""
+        title, rating, review = payload.get('title'), payload.get('rating'), payload.get('review', '')
+        vertex = self.graph.get_item(title) if isinstance(title, str) else None
+        if vertex is None or vertex.kind != 'recipe':
+            raise QueryError("Unknown recipe: " + repr(title))
+        if isinstance(rating, bool) or not isinstance(rating, int) or not 1 <= rating <= 5:
+            raise QueryError('"rating" must be a whole number between 1 and 5')
+        if not isinstance(review, str):
+            raise QueryError('"review" must be a string')
+
+        async with self._write_lock:
+            await asyncio.get_running_loop().run_in_executor(None, save_review, title, rating, review)
+        return {'title': title, 'rating': rating, 'review': review}
+
+
+def _query_from_parameters(kind: str, parameters: dict[str, list[str]]) -> dict[str, Any]:
+    """Return the proj2queries query of the given type described by the parameters of a GET request.
+
+    >>> _query_from_parameters('search', {'ingredients': ['egg,potato'], 'limit': ['3'], 'price': ['20.5']})
+    {'type': 'search', 'ingredients': ['egg', 'potato'], 'limit': 3, 'price': 20.5}
+    >>> _query_from_parameters('search', {'ingredients': ['egg'], 'exclude': ['nut'], 'pantry': ['true']})
+    {'type': 'search', 'ingredients': ['egg'], 'exclude': ['nut'], 'pantry': True}
+    >>> _query_from_parameters('search', {'rating': ['nan']})
+    Traceback (most recent call last):
+    ...
+    proj2queries.QueryError: "rating" must be a finite number
+    """
+    query = {'type': kind}
+    for name, values in parameters.items():
+        value = values[-1]
+        if name in ('ingredients', 'include', 'exclude', 'have'):
+            query[name] = [item.strip() for item in value.split(',') if item.strip()]
+        elif name == 'pantry':
+            if value.lower() not in ('true', 'false', '1', '0'):
+                raise QueryError('"pantry" must be true or false')
+            query[name] = value.lower() in ('true', '1')
+        elif name in ('limit', 'price', 'rating', 'count', 'budget', 'time_budget'):
+            try:
+                query[name] = int(value) if name in ('limit', 'count') else float(value)
+            except ValueError:
+                raise QueryError('"' + name + '" must be a number')
+            if not math.isfinite(query[name]):
+                raise QueryError('"' + name + '" must be a finite number')
+        else:
+            query[name] = value
+    return query
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[tuple[str, str, bool, bytes]]:
+    """Return the method, target, whether to keep the connection alive, and body of the next request on reader,
+    or None if the client closed the connection.
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise HttpError(400, "Malformed request line")
+    method, target, version = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise HttpError(400, "Malformed Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(413, "The request body is too large")
+    body = await reader.readexactly(length) if length > 0 else b''
+    return method, target, keep_alive, body
+
+
+def _encode_response(status: int, response: dict[str, Any], keep_alive: bool) -> bytes:
+    """Return the bytes of an HTTP response with the given status and JSON body."""
+    body = json.dumps(response).encode('utf-8')
+    head = ('HTTP/1.1 ' + str(status) + ' ' + REASONS.get(status, '') + '\r\n'
+            + 'Content-Type: application/json\r\n'
+            + 'Content-Length: ' + str(len(body)) + '\r\n'
+            + 'Connection: ' + ('keep-alive' if keep_alive else 'close') + '\r\n\r\n')
+    return head.encode('latin-1') + body
+
+
+async def serve(graph: Graph, host: str = '127.0.0.1', port: int = 8080, pricefile: Optional[str] = None) -> None:
+    """Serve queries against graph on host and port until the task is cancelled, applying any changes to
+    pricefile as they happen.
+    """
+    server = QueryServer(graph, pricefile)
+    async with await asyncio.start_server(server.handle_connection, host, port) as listener:
+        print("Serving on " + ", ".join(str(sock.getsockname()) for sock in listener.sockets))
+        await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve recipe graph queries over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--uncleaned', default='food copy.csv')
+    parser.add_argument('--ingredients', default='ingredients copy.csv')
+    parser.add_argument('--prices', default='ingredient_prices.csv')
+    parser.add_argument('--snapshot', default='graph.snapshot')
+    parser.add_argument('--stats', metavar='FILE', help="write stage timings and counters as JSON to FILE on exit")
+    parser.add_argument('--stats-memory', action='store_true')
+    parser.add_argument('--lazy-text', action='store_true', help="read recipe text from the recipe file when needed")
+    args = parser.parse_args()
+    if args.stats:
+        proj2stats.enable(args.stats, args.stats_memory)
+
+    print("Saving Starving Students || Loading")
+    main_graph = load_graph(args.uncleaned, args.ingredients, args.prices, snapshot=args.snapshot,
+                            lazy=args.lazy_text)
+    try:
+        asyncio.run(serve(main_graph, args.host, args.port, args.prices))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,203 @@
+"""Compact binary snapshots of a recipe Graph, so that main.py does not have to parse the csv files on every start.
+
+A snapshot file is laid out as follows:
+    - a 16 byte preamble: the magic bytes, the format version and the length of the header
+    - the header: a marshalled dict with the fingerprints of the source csv files and where each section is
+    - the sections, each starting on an 8 byte boundary
+
+Vertices are numbered by their position in graph.filter_kind(''). The prices, vertex kinds and the ingredients
+of each recipe (as vertex numbers, in compressed sparse row form: an offsets array and a targets array) are stored
+as raw arrays that are read straight out of a memory map. Names and recipe text are marshalled lists. A graph of
+lazy recipes (see Recipe) is saved with the byte offset of each recipe's row in the recipe csv file instead of
+its text, and is loaded with lazy recipes again.
+"""
+from __future__ import annotations
+import array
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import sys
+from typing import Any, Optional
+
+import proj2stats
+from proj2functions import Graph, Recipe, RecipeText
+
+MAGIC = b'P2SNAP'
+VERSION = 1
+_PREAMBLE = struct.Struct('<6sHQ')
+_ALIGNMENT = 8
+
+
+def source_fingerprint(path: str) -> tuple[int, int, str]:
+    """Return the size, modification time (in nanoseconds) and a hash of the content of the file at path."""
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+def _sources_unchanged(saved: list, sources: list[str]) -> bool:
+    """Return whether the files in sources are the ones whose fingerprints were saved in a snapshot.
+
+    The size and modification time are checked first, so a changed file is usually caught without reading it.
+    """
+    if [path for path, _ in saved] != sources:
+        return False
+    for path, fingerprint in saved:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime_ns) != tuple(fingerprint[:2]) or source_fingerprint(path) != fingerprint:
+            return False
+    return True
+
+
+def _align(position: int) -> int:
+    """Return the first multiple of _ALIGNMENT that is at least position."""
+    return -(-position // _ALIGNMENT) * _ALIGNMENT
+
+
+@proj2stats.timed('save_snapshot')
+def save_snapshot(graph: Graph, path: str, sources: list[str], settings: Optional[dict] = None) -> None:
+    """Save graph to a snapshot file at path, recording the fingerprints of the source files it was built from,
+    and settings, a dictionary of the load_graph options it was built with that change which graph is built.
+
+    The file is written next to path first and then moved into place, so a crashed save never leaves a
+    half-written snapshot behind.
+    """
+    vertices = graph.filter_kind('')
+    vertex_ids = {vertex.item: i for i, vertex in enumerate(vertices)}
+
+    offsets = array.array('I', [0])
+    targets = array.array('I')
+    recipes = [vertex for vertex in vertices if vertex.kind == 'recipe']
+    for vertex in recipes:
+        targets.extend(vertex_ids[ingredient] for ingredient in vertex.v_cleaned_ingredients)
+        offsets.append(len(targets))
+    if recipes and all(vertex.details.source_offset is not None for vertex in recipes):
+        text_offsets = array.array('Q', (vertex.details.source_offset for vertex in recipes))
+        text_section = ('text_offsets', text_offsets.tobytes())
+    else:
+        recipe_text = [(vertex.details.full_ingredients, vertex.details.instructions, vertex.details.image_name)
+                       for vertex in recipes]
+        text_section = ('recipe_text', marshal.dumps(recipe_text))
+
+    sections = {
+        'names': marshal.dumps([vertex.item for vertex in vertices]),
+        'kinds': bytes(vertex.kind == 'recipe' for vertex in vertices),
+        'prices': array.array('d', (vertex.price for vertex in vertices)).tobytes(),
+        'offsets': offsets.tobytes(),
+        'targets': targets.tobytes(),
+        text_section[0]: text_section[1],
+    }
+
+    table = {}
+    position = 0
+    for name, data in sections.items():
+        table[name] = (position, len(data))
+        position = _align(position + len(data))
+
+    header = marshal.dumps({
+        'byteorder': sys.byteorder,
+        'itemsize': offsets.itemsize,
+        'sources': [(source, source_fingerprint(source)) for source in sources],
+        'settings': settings or {},
+        'sections': table,
+    })
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        file.write(header)
+        start = _align(_PREAMBLE.size + len(header))
+        for name, data in sections.items():
+            file.seek(start + table[name][0])
+            file.write(data)
+    os.replace(temp_path, path)
+
+
+@proj2stats.timed('load_snapshot')
+def load_snapshot(path: str, sources: list[str], lazy: bool = False,
+                  settings: Optional[dict] = None) -> Optional[Graph]:
+    """Return the graph saved in the snapshot file at path. If lazy is True, its recipes are lazy, and read their
+    text from sources[0], the recipe csv file.
+
+    Return None if there is no readable snapshot at path, if it was saved from different versions of the files
+    in sources or with different settings (see save_snapshot), or if its recipes are lazy and lazy is False or the
+    other way around (so the graph has to be built again).
+    """
+    try:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, header_length = _PREAMBLE.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                return None
+
+            header = marshal.loads(data[_PREAMBLE.size:_PREAMBLE.size + header_length])
+            text_section = 'text_offsets' if lazy else 'recipe_text'
+            if header['byteorder'] != sys.byteorder or header['itemsize'] != array.array('I').itemsize \
+                    or text_section not in header['sections'] or header.get('settings', {}) != (settings or {}) \
+                    or not _sources_unchanged(header['sources'], sources):
+                return None
+
+            start = _align(_PREAMBLE.size + header_length)
+            views = []
+            try:
+                with memoryview(data) as whole:
+                    for name in ('kinds', 'prices', 'offsets', 'targets'):
+                        position, length = header['sections'][name]
+                        views.append(whole[start + position:start + position + length])
+                kinds, prices, offsets, targets = views[0], views[1].cast('d'), views[2].cast('I'), views[3].cast('I')
+                views.extend([prices, offsets, targets])
+
+                position, length = header['sections']['names']
+                names = marshal.loads(data[start + position:start + position + length])
+                position, length = header['sections'][text_section]
+                if lazy:
+                    recipe_text = array.array('Q', data[start + position:start + position + length])
+                    return _build_graph(names, kinds, prices, offsets, targets, recipe_text, RecipeText(sources[0]))
+                recipe_text = marshal.loads(data[start + position:start + position + length])
+                return _build_graph(names, kinds, prices, offsets, targets, recipe_text)
+            finally:
+                for view in reversed(views):
+                    view.release()
+    except (OSError, ValueError, EOFError, TypeError, KeyError, struct.error):
+        return None
+
+
+def _build_graph(names: list[str], kinds: memoryview, prices: memoryview, offsets: memoryview,
+                 targets: memoryview, recipe_text: Any, text: Optional[RecipeText] = None) -> Graph:
+    """Return a graph with the given vertices, adding them in order so it matches the graph that was saved.
+
+    recipe_text holds the (full ingredients, instructions, image name) of each recipe, or if text is given, the
+    byte offset of each recipe's row in the file that text reads, for lazy recipes.
+    """
+    graph = Graph()
+    ingredient_prices = {}
+    titles = []
+
+    for vertex_id, name in enumerate(names):
+        if kinds[vertex_id]:
+            recipe_id = len(titles)
+            cleaned_ingredients = [names[i] for i in targets[offsets[recipe_id]:offsets[recipe_id + 1]]]
+            if text is None:
+                full_ingredients, instructions, image_name = recipe_text[recipe_id]
+                recipe = Recipe([name, full_ingredients, instructions, image_name, '', cleaned_ingredients,
+                                 prices[vertex_id]])
+            else:
+                recipe = Recipe([name, None, None, None, '', cleaned_ingredients, prices[vertex_id],
+                                 recipe_text[recipe_id]], text)
+            graph.add_vertex(recipe, ingredient_prices)
+            titles.append(name)
+        else:
+            graph.add_ingredient(name, prices[vertex_id])
+            ingredient_prices[name] = prices[vertex_id]
+
+    for title in titles:
+        graph.add_edge(title)
+
+    return graph
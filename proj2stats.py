@@ -0,0 +1,184 @@
+"""Timers and counters for the stages of loading and querying the recipe graph.
+
+Stats are off unless they are turned on, either with the PROJ2_STATS environment variable or by calling enable
+(main.py does this for its --stats flag). When they are off, timed functions and count do nothing but check a
+flag. When they are on, everything recorded is written as JSON when the program exits:
+
+    PROJ2_STATS=stats.json python main.py           write the stats to stats.json
+    PROJ2_STATS=- python main.py                    write the stats to standard error
+    PROJ2_STATS=- PROJ2_STATS_MEMORY=1 python ...   also trace memory, and report the current and peak usage
+
+The stats are a JSON object like
+    {"timers": {"cleancsv": {"calls": 1, "seconds": 0.42}, ...},
+     "counters": {"cleancsv.rows_parsed": 13501, ...},
+     "memory": {"current_bytes": ..., "peak_bytes": ...}}
+"""
+from __future__ import annotations
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+_enabled = False
+_output = None
+_owner = None
+_timers = {}
+_counters = {}
+
+
+def enabled() -> bool:
+    """Return whether stats are being recorded."""
+    return _enabled
+
+
+def enable(output: Optional[str] = '-', memory: bool = False) -> None:
+    """Start recording stats, and write them as JSON to output ('-' for standard error, None for nowhere) when the
+    program exits. If memory is True, also trace memory allocations, so the stats include the memory in use and
+    its peak.
+    """
+    global _enabled, _output, _owner
+    if output is not None and _output is None:
+        atexit.register(_dump_at_exit)
+    _enabled, _output, _owner = True, output, os.getpid()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Add amount to the counter with the given name, if stats are being recorded."""
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record(name: str, seconds: float) -> None:
+    """Add one call that took the given number of seconds to the timer with the given name."""
+    timer = _timers.get(name)
+    if timer is None:
+        _timers[name] = [1, seconds]
+    else:
+        timer[0] += 1
+        timer[1] += seconds
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Return a decorator that times every call of the function it decorates under the given timer name, while
+    stats are being recorded.
+
+    >>> @timed('double')
+    ... def double(x: int) -> int:
+    ...     return 2 * x
+    >>> double(3)
+    6
+    """
+    def decorate(function: Callable) -> Callable:
+        """Return function wrapped in a timer."""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> Any:
+            """Call the wrapped function, timing it if stats are being recorded."""
+            if not _enabled:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+class Timer:
+    """A context manager that times the code inside it under a timer name, while stats are being recorded.
+
+    >>> with Timer('stage'):
+    ...     pass
+
+    Instance Attributes:
+        - name: the name of the timer
+    """
+    name: str
+    _started: Optional[float]
+
+    def __init__(self, name: str) -> None:
+        """Initialize a timer with the given name."""
+        self.name = name
+        self._started = None
+
+    def __enter__(self) -> Timer:
+        """Start timing."""
+        self._started = time.perf_counter() if _enabled else None
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Stop timing and record the time."""
+        if self._started is not None:
+            record(self.name, time.perf_counter() - self._started)
+
+
+def snapshot() -> dict[str, Any]:
+    """Return everything recorded so far, in the JSON form described at the top of this file."""
+    stats = {
+        'timers': {name: {'calls': calls, 'seconds': round(seconds, 6)} for name, (calls, seconds) in _timers.items()},
+        'counters': dict(_counters),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        stats['memory'] = {'current_bytes': current, 'peak_bytes': peak}
+    return stats
+
+
+def difference(before: dict[str, Any], after: dict[str, Any]) -> dict[str, Any]:
+    """Return the stats recorded between the snapshots before and after, leaving out timers and counters that
+    did not change. The memory usage is the one in after.
+
+    >>> before = {'timers': {'a': {'calls': 1, 'seconds': 0.5}}, 'counters': {'rows': 10, 'drops': 1}}
+    >>> after = {'timers': {'a': {'calls': 3, 'seconds': 0.75}}, 'counters': {'rows': 25, 'drops': 1}}
+    >>> difference(before, after)
+    {'timers': {'a': {'calls': 2, 'seconds': 0.25}}, 'counters': {'rows': 15}}
+    """
+    timers = {}
+    for name, timer in after['timers'].items():
+        previous = before['timers'].get(name, {'calls': 0, 'seconds': 0.0})
+        if timer['calls'] != previous['calls']:
+            timers[name] = {'calls': timer['calls'] - previous['calls'],
+                            'seconds': round(timer['seconds'] - previous['seconds'], 6)}
+    counters = {name: value - before['counters'].get(name, 0) for name, value in after['counters'].items()
+                if value != before['counters'].get(name, 0)}
+    stats = {'timers': timers, 'counters': counters}
+    if 'memory' in after:
+        stats['memory'] = after['memory']
+    return stats
+
+
+def reset() -> None:
+    """Forget everything recorded so far, including the peak memory usage."""
+    _timers.clear()
+    _counters.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+
+def dump(output: str = '-') -> None:
+    """Write everything recorded so far as JSON to output, a file path or '-' for standard error."""
+    text = json.dumps(snapshot(), indent=2)
+    if output == '-':
+        print(text, file=sys.stderr)
+    else:
+        with open(output, 'w', encoding="utf-8") as file:
+            file.write(text + '\n')
+
+
+def _dump_at_exit() -> None:
+    """Write the stats to the output given to enable, if they are still being recorded and this is the process
+    that enabled them (not a worker process started by cleancsv_parallel).
+    """
+    if _enabled and _output is not None and os.getpid() == _owner:
+        dump(_output)
+
+
+if os.environ.get('PROJ2_STATS', '') not in ('', '0'):
+    enable('-' if os.environ['PROJ2_STATS'] == '1' else os.environ['PROJ2_STATS'],
+           os.environ.get('PROJ2_STATS_MEMORY', '') not in ('', '0'))
@@ -21,10 +21,10 @@ please consult our Course Syllabus.
 This file is Copyright (c) 2025 Mario Badr, David Liu, and Isaac Waller.
 """
 # import os
-import networkx as nx
 from plotly.graph_objs import Scatter, Figure
 
 import proj2functions
+import proj2layout
 
 # Colours to use when visualizing different clusters.
 COLOUR_SCHEME = [
@@ -46,8 +46,13 @@ def visualize_graph(graph: proj2functions.Graph,
                     layout: str = 'spring_layout',
                     max_vertices: int = 5000,
                     output_file: str = '',
-                    highlight_ingredients: list[str] = None) -> None:
-    """Visualize the given graph using Plotly and NetworkX."""
+                    highlight_ingredients: list[str] = None,
+                    positions: dict = None) -> None:
+    """Visualize the given graph using Plotly and NetworkX.
+
+    positions maps each vertex to its (x, y) position, such as the ones proj2layout.view_positions gives. If it
+    is not given, the graph is laid out with the given networkx layout, through proj2layout's on-disk cache.
+    """
     graph_nx = graph.to_networkx(max_vertices)
 
     # Prepare node data
@@ -64,7 +69,7 @@ def visualize_graph(graph: proj2functions.Graph,
             graph_nx.nodes[node]['price'] = 'N/A'
             graph_nx.nodes[node]['ingredients'] = 'N/A'
 
-    pos = getattr(nx, layout)(graph_nx)
+    pos = positions if positions is not None else proj2layout.cached_layout(graph_nx, layout)
 
     # Prepare data for plotting
     x_values = [pos[k][0] for k in graph_nx.nodes]
@@ -1,68 +1,375 @@
-import time
+"""Scrape the average price of every ingredient from No Frills into ingredient_prices.csv.
+
+Ingredients are fetched by a small pool of worker threads. Each finished ingredient is appended to a
+checkpoint file straight away, so if the scrape crashes or is stopped, running it again picks up where it
+left off. Where the pages come from is up to a fetch backend: SeleniumBackend drives headless Chrome like
+the original script did, and HttpBackend reads plain HTML (e.g. from a local server with fixture pages).
+
+    python scrape.py --workers 4
+    python scrape.py --backend http --base-url "http://localhost:8000/search?search-bar="
+"""
+from __future__ import annotations
+import argparse
+import csv
+import json
+import os
 import re
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-
-# set up driver and shtuff
-options = Options()
-options.add_argument("--headless")
-driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-
-# csv loading
-ingredients_df = pd.read_csv('ingredients copy.csv')
-ingredient_prices = {}
-
-# scrape from nofrills
-base_url = "https://www.nofrills.ca/en/search?search-bar="
-
-for ingredient in ingredients_df['Aliased Ingredient Name']:
-    try:
-        ingredient_url = base_url + ingredient.replace(' ', '+')
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
 
-        driver.get(ingredient_url)
-        time.sleep(5)
+BASE_URL = "https://www.nofrills.ca/en/search?search-bar="
+ITEM_CLASSES = {"chakra-linkbox", "css-yxqevf"}
+ITEM_SELECTOR = ".chakra-linkbox.css-yxqevf"
+PRICE_TEST_ID = "regular-price"
+ITEMS_PER_INGREDIENT = 5
+# elements that never have an end tag, so they do not open a level of nesting
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track',
+             'wbr'}
 
-        prices = []
-        # selects all elements with this css tag
-        items = driver.find_elements(By.CSS_SELECTOR, ".chakra-linkbox.css-yxqevf")
 
-        for item in items[:5]:
-            try:
-                price_text = item.find_element(By.CSS_SELECTOR, "[data-testid='regular-price']").text.strip()
+class AdaptiveDelay:
+    """A pause between requests, shared by all workers, that adapts to how the site responds.
+
+    Every failure doubles the pause (up to maximum) and every success shortens it a little (down to
+    minimum), so the scraper goes as fast as the site allows without hammering it when it starts failing.
+
+    Instance Attributes:
+        - minimum: the shortest pause, in seconds
+        - maximum: the longest pause, in seconds
+        - current: the pause that is used next, in seconds
+    """
+    minimum: float
+    maximum: float
+    current: float
+    _lock: threading.Lock
+
+    def __init__(self, minimum: float = 0.0, maximum: float = 30.0) -> None:
+        """Initialize a pause that starts at minimum."""
+        self.minimum = minimum
+        self.maximum = maximum
+        self.current = minimum
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Sleep for the current pause."""
+        if self.current > 0:
+            time.sleep(self.current)
+
+    def succeeded(self) -> None:
+        """Shorten the pause after a successful request."""
+        with self._lock:
+            self.current = max(self.minimum, self.current * 0.8 - 0.1)
+
+    def failed(self) -> None:
+        """Lengthen the pause after a failed request."""
+        with self._lock:
+            self.current = min(self.maximum, max(self.current * 2, 1.0))
+
+
+class SeleniumBackend:
+    """Fetches search results with one headless Chrome per worker thread.
 
-                # found this online, uses regex to find float like numbers, and does not include words
-                match = re.search(r"(\d+(\.\d+)?)", price_text)
+    Instead of sleeping for a fixed time after loading a page, it waits until the product items appear,
+    for at most timeout seconds.
+    """
+    timeout: float
+    _local: threading.local
+    _drivers: list
+    _lock: threading.Lock
 
-                if match:
-                    price = float(match.group(1))
-                    prices.append(price)
+    def __init__(self, timeout: float = 10.0) -> None:
+        """Initialize a backend that waits at most timeout seconds for a page's items to appear."""
+        self.timeout = timeout
+        self._local = threading.local()
+        self._drivers = []
+        self._lock = threading.Lock()
 
+    def _driver(self):
+        """Return this thread's Chrome driver, starting it first if needed."""
+        if not hasattr(self._local, 'driver'):
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
+            from selenium.webdriver.chrome.service import Service
+            from webdriver_manager.chrome import ChromeDriverManager
+
+            options = Options()
+            options.add_argument("--headless")
+            self._local.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+            with self._lock:
+                self._drivers.append(self._local.driver)
+        return self._local.driver
+
+    def price_texts(self, url: str) -> list[str]:
+        """Return the regular price text of the first few items on the search page at url."""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver = self._driver()
+        driver.get(url)
+        try:
+            WebDriverWait(driver, self.timeout, poll_frequency=0.25).until(
+                expected_conditions.presence_of_element_located((By.CSS_SELECTOR, ITEM_SELECTOR)))
+        except TimeoutException:
+            return []  # the search found nothing
+
+        texts = []
+        # selects all elements with this css tag
+        for item in driver.find_elements(By.CSS_SELECTOR, ITEM_SELECTOR)[:ITEMS_PER_INGREDIENT]:
+            try:
+                texts.append(item.find_element(By.CSS_SELECTOR, f"[data-testid='{PRICE_TEST_ID}']").text.strip())
             # exception thrown for items that are weird (outta my control LOL)
             except Exception as e:
                 print(f"Skipping item due to error: {e}")
+        return texts
+
+    def close(self) -> None:
+        """Quit every Chrome driver that was started."""
+        for driver in self._drivers:
+            driver.quit()
+        self._drivers.clear()
+
+
+class _PriceParser(HTMLParser):
+    """Collects the regular price text inside each product item of a search page."""
+    texts: list[str]
+    _item_depth: int
+    _depth: int
+    _price_depth: Optional[int]
+    _price: list[str]
+
+    def __init__(self) -> None:
+        """Initialize a parser that has not seen any items yet."""
+        super().__init__()
+        self.texts = []
+        self._depth = 0
+        self._item_depth = 0
+        self._price_depth = None
+        self._price = []
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        """Note where a product item or its regular price starts."""
+        if tag in VOID_TAGS:
+            return
+        self._depth += 1
+        attributes = dict(attrs)
+        if not self._item_depth and ITEM_CLASSES <= set((attributes.get('class') or '').split()):
+            self._item_depth = self._depth
+        elif self._item_depth and self._price_depth is None and attributes.get('data-testid') == PRICE_TEST_ID:
+            self._price_depth = self._depth
+            self._price = []
+
+    def handle_endtag(self, tag: str) -> None:
+        """Save the price text when the price element ends."""
+        if tag in VOID_TAGS:
+            return
+        if self._price_depth == self._depth:
+            self.texts.append(''.join(self._price).strip())
+            self._price_depth = None
+        if self._item_depth == self._depth:
+            self._item_depth = 0
+        self._depth -= 1
+
+    def handle_data(self, data: str) -> None:
+        """Collect text that is inside a price element."""
+        if self._price_depth is not None:
+            self._price.append(data)
+
+
+class HttpBackend:
+    """Fetches search results as plain HTML, without running the page's scripts.
 
-        # takes average price
-        if prices:
-            avg_price = round(sum(prices) / len(prices), 2)
-            ingredient_prices[ingredient] = avg_price
-        else:
-            ingredient_prices[ingredient] = None
+    >>> parser = _PriceParser()
+    >>> parser.feed('<div class="chakra-linkbox css-yxqevf"><img src="a.png"><br>'
+    ...             '<p data-testid="regular-price">$1.00</p></div><p data-testid="regular-price">$99.00</p>')
+    >>> parser.texts
+    ['$1.00']
+    """
+    timeout: float
 
-    # exception thrown if ingredient is weird and can't be searched
-    except Exception as e:
-        print(f"Error processing {ingredient}: {e}")
+    def __init__(self, timeout: float = 10.0) -> None:
+        """Initialize a backend that gives up on a request after timeout seconds."""
+        self.timeout = timeout
 
-# dataframe (it's like an excel spreadsheet hehe)
-results = pd.DataFrame(list(ingredient_prices.items()), columns=["Ingredient", "Average Price"])
+    def price_texts(self, url: str) -> list[str]:
+        """Return the regular price text of the first few items on the search page at url."""
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            html = response.read().decode(response.headers.get_content_charset() or 'utf-8')
+        parser = _PriceParser()
+        parser.feed(html)
+        return parser.texts[:ITEMS_PER_INGREDIENT]
 
-# dataframe can save directly to csv woohoo!
-results.to_csv('ingredient_prices.csv', index=False)
+    def close(self) -> None:
+        """Nothing to release."""
 
-# close
-driver.quit()
 
-print("Scraping complete. Average prices saved to ingredient_prices.csv.")
+def average_price(price_texts: list[str]) -> Optional[float]:
+    """Return the average of the prices in price_texts, rounded to cents, or None if none contain a price.
+
+    >>> average_price(['$3.99', 'about $2 ea', 'sold out'])
+    3.0
+    >>> average_price([]) is None
+    True
+    """
+    prices = []
+    for price_text in price_texts:
+        # found this online, uses regex to find float like numbers, and does not include words
+        match = re.search(r"(\d+(\.\d+)?)", price_text)
+        if match:
+            prices.append(float(match.group(1)))
+
+    # takes average price
+    if prices:
+        return round(sum(prices) / len(prices), 2)
+    return None
+
+
+def load_checkpoint(path: str) -> dict[str, Optional[float]]:
+    """Return the prices already saved in the checkpoint file at path (an empty dict if there is none).
+
+    A last line that was cut off by a crash is ignored.
+    """
+    done = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[entry['ingredient']] = entry['price']
+    return done
+
+
+def scrape_prices(ingredients: list[str], backend, checkpoint: str, workers: int = 4, base_url: str = BASE_URL,
+                  retries: int = 3, delay: Optional[AdaptiveDelay] = None) -> dict[str, Optional[float]]:
+    """Return the average price of each ingredient, scraping only those not already in the checkpoint file.
+
+    Each ingredient is fetched by one of workers threads and appended to the checkpoint file as soon as it
+    is done. An ingredient that still fails after retries attempts is left out of the result and the
+    checkpoint, so the next run tries it again.
+    """
+    results = load_checkpoint(checkpoint)
+    todo = [ingredient for ingredient in ingredients if ingredient not in results]
+    delay = delay or AdaptiveDelay()
+    lock = threading.Lock()
+
+    def fetch(ingredient: str) -> Optional[float]:
+        """Return the average price of ingredient, retrying failed requests."""
+        ingredient_url = base_url + ingredient.replace(' ', '+')
+        for attempt in range(retries):
+            delay.wait()
+            try:
+                price = average_price(backend.price_texts(ingredient_url))
+            # exception thrown if ingredient is weird and can't be searched
+            except Exception as e:
+                delay.failed()
+                if attempt == retries - 1:
+                    raise
+                print(f"Retrying {ingredient} after error: {e}")
+            else:
+                delay.succeeded()
+                return price
+        return None
+
+    with open(checkpoint, 'a', encoding="utf-8") as checkpoint_file, ThreadPoolExecutor(workers) as pool:
+        futures = {pool.submit(fetch, ingredient): ingredient for ingredient in todo}
+        for future in as_completed(futures):
+            ingredient = futures[future]
+            try:
+                price = future.result()
+            except Exception as e:
+                print(f"Error processing {ingredient}: {e}")
+                continue
+            with lock:
+                results[ingredient] = price
+                checkpoint_file.write(json.dumps({'ingredient': ingredient, 'price': price}) + '\n')
+                checkpoint_file.flush()
+            print(f"{len(results)}/{len(ingredients)} {ingredient}: {price}")
+
+    return results
+
+
+def write_prices(path: str, ingredients: list[str], prices: dict[str, Optional[float]]) -> None:
+    """Write the price of every ingredient to the csv file at path, leaving unknown prices empty."""
+    with open(path, 'w', encoding="utf-8", newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Ingredient", "Average Price"])
+        for ingredient in ingredients:
+            price = prices.get(ingredient)
+            writer.writerow([ingredient, '' if price is None else price])
+
+
+def fixture_server(pages: dict[str, str]) -> ThreadingHTTPServer:
+    """Start a local HTTP server in a background thread that answers a search for each ingredient in pages with
+    its HTML (and searches for anything else with a page of no items), for testing the scraper end to end. Its
+    search URL is 'http://127.0.0.1:<port>/search?search-bar=', where port is its server_port. Stop it with its
+    shutdown method.
+
+    >>> import os, tempfile
+    >>> item = '<div class="chakra-linkbox css-yxqevf"><img src="x.png"><p data-testid="regular-price">{}</p></div>'
+    >>> server = fixture_server({'egg': item.format('$3.00') + item.format('$4.00'), 'olive oil': item.format('$8')})
+    >>> base_url = 'http://127.0.0.1:' + str(server.server_port) + '/search?search-bar='
+    >>> checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.jsonl')
+    >>> prices = scrape_prices(['egg', 'olive oil', 'saffron'], HttpBackend(), checkpoint, 1, base_url)
+    1/3 egg: 3.5
+    2/3 olive oil: 8.0
+    3/3 saffron: None
+    >>> scrape_prices(['egg', 'olive oil', 'saffron'], HttpBackend(), checkpoint, 2, base_url) == prices
+    True
+    >>> server.shutdown()
+    """
+    class FixtureHandler(BaseHTTPRequestHandler):
+        """Answers searches with the fixture pages."""
+
+        def do_GET(self) -> None:
+            """Send the page for the ingredient searched for."""
+            ingredient = parse_qs(urlsplit(self.path).query).get('search-bar', [''])[0]
+            body = ('<html><body>' + pages.get(ingredient, '') + '</body></html>').encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            """Keep requests out of standard error."""
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def read_ingredients(path: str) -> list[str]:
+    """Return the 'Aliased Ingredient Name' of every row in the ingredients csv file at path."""
+    with open(path, 'r', encoding="utf-8") as file:
+        return [row['Aliased Ingredient Name'] for row in csv.DictReader(file)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scrape ingredient prices into a csv file.")
+    parser.add_argument('--ingredients', default='ingredients copy.csv')
+    parser.add_argument('--output', default='ingredient_prices.csv')
+    parser.add_argument('--checkpoint', default='ingredient_prices.checkpoint.jsonl')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--backend', choices=['selenium', 'http'], default='selenium')
+    parser.add_argument('--base-url', default=BASE_URL)
+    args = parser.parse_args()
+
+    all_ingredients = read_ingredients(args.ingredients)
+    fetch_backend = SeleniumBackend() if args.backend == 'selenium' else HttpBackend()
+    try:
+        ingredient_prices = scrape_prices(all_ingredients, fetch_backend, args.checkpoint, args.workers,
+                                          args.base_url)
+    finally:
+        fetch_backend.close()
+
+    write_prices(args.output, all_ingredients, ingredient_prices)
+    print("Scraping complete. Average prices saved to " + args.output + ".")